@@ -0,0 +1,104 @@
+"""
+asyncio front end for the Chicken Bites API
+
+Connections are held by coroutines, so idle keep-alive clients cost almost
+nothing. Each parsed request is replayed through the regular APIHandler on a
+bounded thread pool, which keeps routing identical and the JSON responses
+byte-for-byte the same as the http.server engine.
+"""
+import asyncio
+import io
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from server import APIHandler, db, start_background_jobs, stop_background_jobs
+
+MAX_HEADER_BYTES = 65536
+
+def _handle_request(raw: bytes, client_address, requests_handled: int) -> tuple:
+    """Run one raw HTTP request through APIHandler and return (response bytes, close)"""
+    handler = APIHandler.__new__(APIHandler)
+    handler.rfile = io.BytesIO(raw)
+    handler.wfile = io.BytesIO()
+    handler.client_address = client_address
+    handler.server = None
+    handler.request = None
+    handler.close_connection = True
+    # Carry the connection's request count so the keep-alive cap applies here too
+    handler.requests_handled = requests_handled
+    handler.handle_one_request()
+    return handler.wfile.getvalue(), handler.close_connection
+
+def _content_length(head: bytes) -> int:
+    """Read Content-Length from a raw request head"""
+    for line in head.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'content-length':
+            return int(value.strip() or 0)
+    return 0
+
+async def _serve_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, executor: ThreadPoolExecutor):
+    """Serve requests on one client connection until either side closes it"""
+    loop = asyncio.get_running_loop()
+    client_address = writer.get_extra_info('peername') or ('', 0)
+    requests_handled = 0
+    try:
+        while True:
+            try:
+                head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), APIHandler.timeout)
+            except (asyncio.IncompleteReadError, asyncio.TimeoutError, asyncio.LimitOverrunError, ConnectionError):
+                break
+            try:
+                length = _content_length(head)
+            except ValueError:
+                break
+            body = await reader.readexactly(length) if length > 0 else b''
+            response, close = await loop.run_in_executor(executor, _handle_request, head + body, client_address, requests_handled)
+            requests_handled += 1
+            writer.write(response)
+            await writer.drain()
+            if close:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+async def serve(port: int, workers: int = 16, backlog: int = 128):
+    """Accept connections on port until cancelled"""
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api-worker')
+    server = await asyncio.start_server(
+        lambda reader, writer: _serve_connection(reader, writer, executor),
+        host='0.0.0.0',
+        port=port,
+        backlog=backlog,
+        limit=MAX_HEADER_BYTES
+    )
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, server.close)
+    except (NotImplementedError, RuntimeError):
+        pass  # Signal handlers are unavailable on Windows event loops
+    print(f"Server running on port {port} (asyncio, {workers} workers)")
+    try:
+        async with server:
+            await server.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        executor.shutdown(wait=True)
+
+def run_async_server(port: int, workers: int = 16, backlog: int = 128):
+    """Run the asyncio engine in the current thread"""
+    db.connect()
+    start_background_jobs()
+    try:
+        asyncio.run(serve(port, workers, backlog))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_background_jobs()
+        db.disconnect()
@@ -2,11 +2,25 @@
 Admin API - handles admin operations
 """
 from .database import Database
+from .catalog import ProductCatalog
+from .stats import DashboardStats
+from .pagination import fetch_page
+from .projection import select_list, with_required
+from .order_api import MANAGED_ORDER_COLUMNS
+from .user_api import USER_COLUMNS
+from .search_index import OrderSearchIndex
 from typing import List, Dict, Optional, Tuple
 
+# Above this many matches the id list is no cheaper than the LIKE scan
+MAX_SEARCH_IDS = 5000
+
 class AdminAPI:
-    def __init__(self, db: Database):
+    def __init__(self, db: Database, catalog: Optional[ProductCatalog] = None, stats: Optional[DashboardStats] = None,
+                 order_search: Optional[OrderSearchIndex] = None):
         self.db = db
+        self.catalog = catalog
+        self.order_search = order_search
+        self.stats = stats
     
     # Dashboard Stats
     def get_total_pending_orders(self) -> int:
@@ -52,6 +66,13 @@ class AdminAPI:
         return result[0]['total'] if result else 0
     
     # Products Management
+    def get_all_products(self, sort_by: str = 'all', search: str = '') -> List[Dict]:
+        """Get all products with optional sorting and search"""
+        if self.catalog is not None:
+            return self.catalog.get_all_products(sort_by, search) or []
+        from .product_api import ProductAPI
+        return ProductAPI(self.db).get_all_products(sort_by, search)
+    
     def add_product(self, product_data: Dict) -> Tuple[bool, str]:
         """Add a new product"""
         # Check if product name already exists
@@ -74,6 +95,10 @@ class AdminAPI:
         )
         
         if self.db.execute_update(insert_query, params):
+            if self.catalog is not None:
+                self.catalog.refresh_product(self.db.get_last_insert_id())
+            if self.stats is not None:
+                self.stats.product_added()
             return True, "Product added successfully!"
         return False, "Failed to add product!"
     
@@ -165,6 +190,8 @@ class AdminAPI:
             )
         
         if self.db.execute_update(update_query, params):
+            if self.catalog is not None:
+                self.catalog.refresh_product(product_id)
             return True, "Product updated successfully!"
         return False, "Failed to update product!"
     
@@ -172,14 +199,17 @@ class AdminAPI:
         """Delete a product"""
         query = "DELETE FROM products WHERE id = %s"
         if self.db.execute_update(query, (product_id,)):
+            if self.catalog is not None:
+                self.catalog.remove_product(product_id)
+            if self.stats is not None:
+                self.stats.product_deleted()
             return True, "Product deleted successfully!"
         return False, "Failed to delete product!"
     
     # Orders Management
-    def get_all_orders(self, status_filter: str = 'all', search: str = '') -> List[Dict]:
-        """Get all orders with optional filtering"""
-        query = """
-            SELECT orders.*, users.name, users.fname, users.mname, users.lname 
+    def _orders_query(self, status_filter: str, search: str, fields: List[str]) -> Tuple[str, List]:
+        query = f"""
+            SELECT {select_list(MANAGED_ORDER_COLUMNS, fields)} 
             FROM orders
             JOIN users ON orders.user_id = users.id
             WHERE 1=1
@@ -191,29 +221,62 @@ class AdminAPI:
             params.append(status_filter)
         
         if search:
-            query += " AND (orders.id LIKE %s OR orders.name LIKE %s OR orders.email LIKE %s OR orders.oid LIKE %s)"
-            search_param = f"%{search}%"
-            params.extend([search_param, search_param, search_param, search_param])
-        
-        query += " ORDER BY placed_on DESC"
+            ids = self.order_search.search(search) if self.order_search is not None else None
+            if ids is not None and len(ids) <= MAX_SEARCH_IDS:
+                # Resolved in memory: look the matches up by primary key
+                if ids:
+                    query += f" AND orders.id IN ({', '.join(['%s'] * len(ids))})"
+                    params.extend(sorted(ids))
+                else:
+                    query += " AND 1=0"
+            else:
+                query += " AND (orders.id LIKE %s OR orders.name LIKE %s OR orders.email LIKE %s OR orders.oid LIKE %s)"
+                search_param = f"%{search}%"
+                params.extend([search_param, search_param, search_param, search_param])
+        return query, params
+    
+    def get_all_orders(self, status_filter: str = 'all', search: str = '', fields: Optional[List[str]] = None) -> List[Dict]:
+        """Get all orders with optional filtering (fields: MANAGED_ORDER_COLUMNS to select, default all)"""
+        query, params = self._orders_query(status_filter, search, with_required(fields or MANAGED_ORDER_COLUMNS, ['id']))
+        query += " ORDER BY placed_on DESC, orders.id DESC"
         
         result = self.db.execute_query(query, tuple(params) if params else None)
         return result if result else []
     
+    def get_all_orders_page(self, status_filter: str, search: str, limit: int,
+                            after: Optional[str] = None, fields: Optional[List[str]] = None) -> Tuple[List[Dict], Optional[str]]:
+        """One page of get_all_orders, plus the cursor for the next page"""
+        columns = [('orders.placed_on', 'DESC', 'placed_on'), ('orders.id', 'DESC', 'id')]
+        fields = with_required(fields or MANAGED_ORDER_COLUMNS, [key for _, _, key in columns])
+        query, params = self._orders_query(status_filter, search, fields)
+        return fetch_page(self.db, query, params, columns, limit, after)
+    
     def update_order_status(self, order_id: int, status: str) -> Tuple[bool, str]:
         """Update order payment status"""
         # Map 'completed' to 'delivered' to match PHP behavior
         if status == 'completed':
             status = 'delivered'
         
+        # Previous status, so the dashboard counters can move the order between buckets
+        current = None
+        if self.stats is not None:
+            current = self.db.execute_query("SELECT payment_status, total_price FROM orders WHERE id = %s", (order_id,))
+        
         query = "UPDATE orders SET payment_status = %s WHERE id = %s"
         if self.db.execute_update(query, (status, order_id)):
+            if current:
+                self.stats.order_status_changed(current[0]['payment_status'], status, current[0]['total_price'])
             return True, "Order status updated successfully!"
         return False, "Failed to update order status!"
     
     def delete_order(self, order_id: int) -> Tuple[bool, str]:
         """Delete an order and its items"""
         try:
+            # Remember the order's status for the dashboard counters
+            current = None
+            if self.stats is not None:
+                current = self.db.execute_query("SELECT payment_status, total_price FROM orders WHERE id = %s", (order_id,))
+            
             # Delete order items first
             delete_items_query = "DELETE FROM order_items WHERE order_id = %s"
             self.db.execute_update(delete_items_query, (order_id,))
@@ -221,37 +284,48 @@ class AdminAPI:
             # Delete order
             delete_order_query = "DELETE FROM orders WHERE id = %s"
             if self.db.execute_update(delete_order_query, (order_id,)):
+                if current:
+                    self.stats.order_deleted(current[0]['payment_status'], current[0]['total_price'])
+                if self.order_search is not None:
+                    self.order_search.order_removed(order_id)
                 return True, "Order deleted successfully!"
             return False, "Failed to delete order!"
         except Exception as e:
             return False, f"Error deleting order: {str(e)}"
     
     # Users Management
-    def get_all_users(self, user_type: str = 'all', sort_by: str = 'newest') -> List[Dict]:
-        """Get all users, optionally filtered by type and sorted"""
-        # Build base query
+    # sort_by -> ordering; every ordering ends in id so it is stable
+    USER_SORTS = {
+        'newest': [('id', 'DESC', 'id')],
+        'oldest': [('id', 'ASC', 'id')],
+        'name_asc': [('name', 'ASC', 'name'), ('id', 'ASC', 'id')],
+        'name_desc': [('name', 'DESC', 'name'), ('id', 'DESC', 'id')]
+    }
+    
+    def _users_query(self, user_type: str, fields: List[str]) -> Tuple[str, List]:
+        query = f"SELECT {select_list(USER_COLUMNS, fields)} FROM users"
         if user_type == 'all':
-            query = "SELECT * FROM users"
-            params = []
-        else:
-            query = "SELECT * FROM users WHERE user_type = %s"
-            params = [user_type]
+            return query + " WHERE 1=1", []
+        return query + " WHERE user_type = %s", [user_type]
+    
+    def get_all_users(self, user_type: str = 'all', sort_by: str = 'newest', fields: Optional[List[str]] = None) -> List[Dict]:
+        """Get all users, optionally filtered by type and sorted (fields: USER_COLUMNS to select, default all)"""
+        query, params = self._users_query(user_type, with_required(fields or USER_COLUMNS, ['id']))
         
-        # Add sorting
-        if sort_by == 'newest':
-            query += " ORDER BY id DESC"
-        elif sort_by == 'oldest':
-            query += " ORDER BY id ASC"
-        elif sort_by == 'name_asc':
-            query += " ORDER BY name ASC"
-        elif sort_by == 'name_desc':
-            query += " ORDER BY name DESC"
-        else:
-            query += " ORDER BY id DESC"  # Default to newest
+        # Add sorting (default to newest)
+        columns = self.USER_SORTS.get(sort_by, self.USER_SORTS['newest'])
+        query += " ORDER BY " + ', '.join(f"{expr} {direction}" for expr, direction, _ in columns)
         
         result = self.db.execute_query(query, tuple(params) if params else None)
         return result if result else []
     
+    def get_all_users_page(self, user_type: str, sort_by: str, limit: int, after: Optional[str] = None,
+                           fields: Optional[List[str]] = None) -> Tuple[List[Dict], Optional[str]]:
+        """One page of get_all_users, plus the cursor for the next page"""
+        columns = self.USER_SORTS.get(sort_by, self.USER_SORTS['newest'])
+        query, params = self._users_query(user_type, with_required(fields or USER_COLUMNS, [key for _, _, key in columns]))
+        return fetch_page(self.db, query, params, columns, limit, after)
+    
     def register_user(self, user_data: Dict, user_type: str = 'client') -> Tuple[bool, str, int]:
         """Register a new user (admin can create clients, admins, or staff)"""
         # Check if username or email already exists
@@ -304,6 +378,8 @@ class AdminAPI:
             get_id_query = "SELECT id FROM users WHERE name = %s AND email = %s ORDER BY id DESC LIMIT 1"
             result = self.db.execute_query(get_id_query, (user_data['name'], user_data['email']))
             user_id = result[0]['id'] if result else 0
+            if self.stats is not None:
+                self.stats.user_added(user_type)
             return True, f"{user_type.capitalize()} registered successfully!", user_id
         return False, f"Failed to register {user_type}!", 0
     
@@ -332,6 +408,12 @@ class AdminAPI:
             # Finally, delete the user
             delete_user_query = "DELETE FROM users WHERE id = %s"
             if self.db.execute_update(delete_user_query, (user_id,)):
+                if self.stats is not None:
+                    # The user's orders went too; reseed rather than track them one by one
+                    self.stats.invalidate()
+                if self.order_search is not None:
+                    for order_id in order_ids:
+                        self.order_search.order_removed(order_id)
                 return True, "User deleted successfully!"
             return False, "Failed to delete user!"
         except Exception as e:
@@ -2,51 +2,104 @@
 Cart API - handles shopping cart operations
 """
 from .database import Database
-from typing import List, Dict, Optional
+from .cart_store import WriteBehindCartStore, CART_SELECT
+from .catalog import ProductCatalog
+from typing import List, Dict, Optional, Tuple
+from decimal import Decimal, InvalidOperation
+import time
 
 class CartAPI:
-    def __init__(self, db: Database):
+    def __init__(self, db: Database, store: Optional[WriteBehindCartStore] = None,
+                 catalog: Optional[ProductCatalog] = None):
         self.db = db
+        self.store = store  # Serve carts from memory and write them behind when set
+        self.catalog = catalog  # Source of cart line name, price and image when set
+    
+    @staticmethod
+    def _valid_quantity(quantity) -> bool:
+        return isinstance(quantity, int) and not isinstance(quantity, bool) and quantity >= 1
+    
+    def _product_data(self, product_id, product_data) -> Optional[Dict]:
+        """Name, price and image for a new cart line, or None if the product is invalid.
+        
+        Taken from the catalog when there is one; otherwise the client's
+        product_data is used after checking the price is a non-negative number.
+        """
+        if self.catalog is not None:
+            product = self.catalog.get_product(product_id) if isinstance(product_id, int) else None
+            if product is None:
+                return None
+            return {'name': product['name'], 'price': product['price'], 'image': product['image']}
+        if not isinstance(product_data, dict) or not isinstance(product_data.get('name'), str):
+            return None
+        try:
+            price = Decimal(str(product_data.get('price')))
+        except InvalidOperation:
+            return None
+        if not price.is_finite() or price < 0:
+            return None
+        return {'name': product_data['name'], 'price': price, 'image': product_data.get('image')}
     
     def add_to_cart(self, user_id: int, product_id: int, quantity: int, product_data: Dict) -> tuple[bool, str]:
-        """Add product to cart"""
-        # Check if item already in cart
-        check_query = "SELECT * FROM cart WHERE user_id = %s AND pid = %s"
-        existing = self.db.execute_query(check_query, (user_id, product_id))
+        """Add product to cart, or add to the quantity if it is already there"""
+        if not self._valid_quantity(quantity):
+            return False, "Quantity must be a positive integer!"
+        product_data = self._product_data(product_id, product_data)
+        if product_data is None:
+            return False, "Invalid product!"
+        if self.store is not None:
+            added = self.store.add(user_id, product_id, quantity, product_data)
+            if added is None:
+                return False, "Failed to add to cart!"
+            return True, "Added to cart!" if added else "Cart updated!"
         
-        if existing and len(existing) > 0:
-            # Update quantity
-            new_quantity = existing[0]['quantity'] + quantity
-            update_query = "UPDATE cart SET quantity = %s WHERE user_id = %s AND pid = %s"
-            if self.db.execute_update(update_query, (new_quantity, user_id, product_id)):
-                return True, "Cart updated!"
-            return False, "Failed to update cart!"
-        else:
-            # Insert new item
-            insert_query = """
-                INSERT INTO cart (user_id, pid, name, price, quantity, image) 
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """
-            params = (
-                user_id,
-                product_id,
-                product_data['name'],
-                product_data['price'],
-                quantity,
-                product_data['image']
-            )
-            if self.db.execute_update(insert_query, params):
-                return True, "Added to cart!"
+        # One statement backed by the unique (user_id, pid) index, so concurrent adds cannot duplicate rows
+        query = """
+            INSERT INTO cart (user_id, pid, name, price, quantity, image) 
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity)
+        """
+        params = (
+            user_id,
+            product_id,
+            product_data['name'],
+            product_data['price'],
+            quantity,
+            product_data['image']
+        )
+        if not self.db.execute_update(query, params):
             return False, "Failed to add to cart!"
+        # MySQL reports 1 affected row for an insert and 2 for an update of an existing row
+        if self.db.get_last_rowcount() == 1:
+            return True, "Added to cart!"
+        return True, "Cart updated!"
     
     def get_cart(self, user_id: int) -> List[Dict]:
         """Get all cart items for user"""
-        query = "SELECT * FROM cart WHERE user_id = %s"
+        if self.store is not None:
+            return self.store.get_cart(user_id) or []
+        query = f"SELECT {CART_SELECT} FROM cart WHERE user_id = %s"
         result = self.db.execute_query(query, (user_id,))
         return result if result else []
     
+    @staticmethod
+    def _total(cart_items: List[Dict]) -> Decimal:
+        """Exact sum of price * quantity"""
+        return sum((Decimal(str(item['price'])) * item['quantity'] for item in cart_items), Decimal('0'))
+    
+    def get_cart_with_total(self, user_id: int) -> Tuple[List[Dict], Decimal]:
+        """Get cart items and their total from a single query"""
+        cart_items = self.get_cart(user_id)
+        return cart_items, self._total(cart_items)
+    
     def update_quantity(self, cart_id: int, quantity: int) -> tuple[bool, str]:
         """Update cart item quantity"""
+        if not self._valid_quantity(quantity):
+            return False, "Quantity must be a positive integer!"
+        if self.store is not None:
+            if self.store.set_quantity(cart_id, quantity):
+                return True, "Quantity updated!"
+            return False, "Failed to update quantity!"
         query = "UPDATE cart SET quantity = %s WHERE id = %s"
         if self.db.execute_update(query, (quantity, cart_id)):
             return True, "Quantity updated!"
@@ -54,6 +107,10 @@ class CartAPI:
     
     def remove_item(self, cart_id: int) -> tuple[bool, str]:
         """Remove item from cart"""
+        if self.store is not None:
+            if self.store.remove(cart_id):
+                return True, "Item removed!"
+            return False, "Failed to remove item!"
         query = "DELETE FROM cart WHERE id = %s"
         if self.db.execute_update(query, (cart_id,)):
             return True, "Item removed!"
@@ -61,17 +118,125 @@ class CartAPI:
     
     def clear_cart(self, user_id: int) -> tuple[bool, str]:
         """Clear all items from cart"""
+        if self.store is not None:
+            self.store.clear(user_id)
+            return True, "Cart cleared!"
         query = "DELETE FROM cart WHERE user_id = %s"
         if self.db.execute_update(query, (user_id,)):
             return True, "Cart cleared!"
         return False, "Failed to clear cart!"
     
+    @staticmethod
+    def _validate_batch(operations) -> Optional[str]:
+        """Return an error message for a malformed operations list, or None"""
+        if not isinstance(operations, list) or not operations:
+            return "Operations must be a non-empty list!"
+        for op in operations:
+            if not isinstance(op, dict):
+                return "Each operation must be an object!"
+            kind = op.get('op')
+            if kind == 'add':
+                product_data = op.get('product_data')
+                if op.get('product_id') is None or not isinstance(product_data, dict):
+                    return "Add operations need product_id and product_data!"
+                if any(key not in product_data for key in ('name', 'price', 'image')):
+                    return "product_data needs name, price and image!"
+            elif kind in ('update', 'remove'):
+                if not isinstance(op.get('cart_id'), int) or isinstance(op.get('cart_id'), bool):
+                    return f"{kind.capitalize()} operations need a cart_id!"
+            else:
+                return f"Unknown cart operation: {kind}"
+            if kind in ('add', 'update'):
+                quantity = op.get('quantity', 1)
+                if not CartAPI._valid_quantity(quantity):
+                    return "Quantity must be a positive integer!"
+        return None
+    
+    def apply_batch(self, user_id: int, operations: List[Dict]) -> Tuple[bool, str, List[Dict], Decimal]:
+        """Apply add/update/remove operations to one user's cart in a single transaction.
+        
+        Each kind runs as one statement: updates first, then removes (so removing
+        a line wins over updating it), then adds. Update and remove only touch
+        this user's lines. Returns the final cart and its total.
+        """
+        error = self._validate_batch(operations)
+        if error:
+            return False, error, [], Decimal('0')
+        resolved = []
+        for op in operations:
+            if op['op'] == 'add':
+                product_data = self._product_data(op['product_id'], op['product_data'])
+                if product_data is None:
+                    return False, "Invalid product!", [], Decimal('0')
+                op = {**op, 'product_data': product_data}
+            resolved.append(op)
+        operations = resolved
+        
+        if self.store is not None:
+            cart_items = self.store.apply_batch(user_id, operations)
+            if cart_items is None:
+                return False, "Failed to update cart!", [], Decimal('0')
+            return True, "Cart updated!", cart_items, self._total(cart_items)
+        
+        updates = [(op['cart_id'], op.get('quantity', 1)) for op in operations if op['op'] == 'update']
+        removes = [op['cart_id'] for op in operations if op['op'] == 'remove']
+        adds = [
+            (user_id, op['product_id'], op['product_data']['name'], op['product_data']['price'], op.get('quantity', 1), op['product_data']['image'])
+            for op in operations if op['op'] == 'add'
+        ]
+        
+        try:
+            with self.db.transaction() as cursor:
+                if updates:
+                    cases = ' '.join('WHEN %s THEN %s' for _ in updates)
+                    placeholders = ', '.join(['%s'] * len(updates))
+                    params = [value for pair in updates for value in pair]
+                    params += [user_id] + [cart_id for cart_id, _ in updates]
+                    cursor.execute(
+                        f"UPDATE cart SET quantity = CASE id {cases} END WHERE user_id = %s AND id IN ({placeholders})",
+                        tuple(params)
+                    )
+                if removes:
+                    placeholders = ', '.join(['%s'] * len(removes))
+                    cursor.execute(f"DELETE FROM cart WHERE user_id = %s AND id IN ({placeholders})", (user_id, *removes))
+                if adds:
+                    rows = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(adds))
+                    cursor.execute(
+                        f"""
+                        INSERT INTO cart (user_id, pid, name, price, quantity, image) 
+                        VALUES {rows}
+                        ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity)
+                        """,
+                        tuple(value for row in adds for value in row)
+                    )
+                cursor.execute(f"SELECT {CART_SELECT} FROM cart WHERE user_id = %s", (user_id,))
+                cart_items = cursor.fetchall()
+        except Exception as e:
+            return False, f"Error updating cart: {str(e)}", [], Decimal('0')
+        
+        return True, "Cart updated!", cart_items, self._total(cart_items)
+    
+    def expire_abandoned(self, ttl: float, batch_size: int = 500, pause: float = 0.1) -> int:
+        """Delete cart rows untouched for ttl seconds, batch_size rows per statement.
+        
+        Pauses between batches so the deletes do not crowd out request traffic.
+        Returns the number of rows removed.
+        """
+        query = """
+            DELETE FROM cart WHERE updated_at < NOW() - INTERVAL %s SECOND
+            ORDER BY updated_at LIMIT %s
+        """
+        removed = 0
+        while self.db.execute_update(query, (int(ttl), batch_size)):
+            deleted = self.db.get_last_rowcount()
+            removed += deleted
+            if deleted < batch_size:
+                break
+            time.sleep(pause)
+        return removed
+    
     def get_cart_total(self, user_id: int) -> float:
         """Calculate cart total"""
-        cart_items = self.get_cart(user_id)
-        total = 0
-        for item in cart_items:
-            total += item['price'] * item['quantity']
-        return total
+        return float(self._total(self.get_cart(user_id)))
 
 
@@ -0,0 +1,169 @@
+"""
+Idempotency keys - replay the original response when a client retries a write
+
+Clients send an Idempotency-Key header with POST requests. The first request
+with a key runs normally and its response is remembered; retries with the
+same key and body get that response back instead of repeating the write.
+Only successful responses are remembered: a failure (a 5xx or a body with
+success false, such as a database timeout) frees the key so a retry runs again.
+Keys live in a bounded in-memory LRU with a TTL and can also be persisted to
+the idempotency_keys table, which makes them visible to every worker process.
+"""
+from .database import Database
+from .serialization import json_default
+from typing import Dict, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import json
+import threading
+import time
+
+class IdempotencyStore:
+    NEW = 'new'  # Caller owns the key and must call complete() or abort()
+    REPLAY = 'replay'  # A stored response exists for this key and body
+    MISMATCH = 'mismatch'  # The key was used with a different body
+    BUSY = 'busy'  # Another request with this key is still running
+
+    def __init__(self, db: Optional[Database] = None, max_entries: int = 10000, ttl: float = 86400,
+                 persist: bool = False, wait_timeout: float = 30):
+        self.db = db
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist = persist and db is not None
+        self.wait_timeout = wait_timeout
+        self._entries: OrderedDict = OrderedDict()  # key -> (expires_at, fingerprint, status, body)
+        self._in_flight: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(body) -> str:
+        """Stable hash of a request body"""
+        return hashlib.sha256(json.dumps(body, sort_keys=True, default=json_default).encode()).hexdigest()
+
+    def _lookup(self, key: str, fingerprint: str) -> Optional[Tuple[str, Optional[Dict]]]:
+        """Check the in-memory entries (caller holds the lock)"""
+        now = time.monotonic()
+        # Entries share one TTL, so the oldest insertions expire first
+        while self._entries:
+            oldest_key, oldest = next(iter(self._entries.items()))
+            if oldest[0] > now:
+                break
+            self._entries.pop(oldest_key)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        if entry[1] != fingerprint:
+            return self.MISMATCH, None
+        return self.REPLAY, {'status': entry[2], 'body': entry[3]}
+
+    def _remember(self, key: str, fingerprint: str, status: int, body):
+        """Store a response in memory (caller holds the lock)"""
+        self._entries[key] = (time.monotonic() + self.ttl, fingerprint, status, body)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _claim_persisted(self, key: str, fingerprint: str) -> Tuple[str, Optional[Dict]]:
+        """Reserve the key in the database, or read the response another worker stored"""
+        for _ in range(2):
+            if not self.db.execute_update(
+                "INSERT IGNORE INTO idempotency_keys (idem_key, fingerprint) VALUES (%s, %s)",
+                (key, fingerprint)
+            ):
+                return self.NEW, None  # Table unavailable: fall back to in-memory behaviour
+            if self.db.get_last_rowcount() == 1:
+                return self.NEW, None
+            result = self.db.execute_query(
+                """
+                SELECT fingerprint, status, response, created_at < NOW() - INTERVAL %s SECOND AS expired
+                FROM idempotency_keys WHERE idem_key = %s
+                """,
+                (int(self.ttl), key)
+            )
+            if not result:
+                continue  # Deleted in between; try to claim again
+            row = result[0]
+            if row['expired']:
+                self.db.execute_update("DELETE FROM idempotency_keys WHERE idem_key = %s", (key,))
+                continue
+            if row['fingerprint'] != fingerprint:
+                return self.MISMATCH, None
+            if row['status'] is None:
+                return self.BUSY, None
+            body = json.loads(row['response'])
+            with self._lock:
+                self._remember(key, fingerprint, row['status'], body)
+            return self.REPLAY, {'status': row['status'], 'body': body}
+        return self.BUSY, None
+
+    def begin(self, key: str, fingerprint: str) -> Tuple[str, Optional[Dict]]:
+        """Start handling a keyed request.
+
+        Returns (state, record); record holds 'status' and 'body' for REPLAY.
+        Concurrent requests with the same key wait for the first to finish.
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            with self._lock:
+                found = self._lookup(key, fingerprint)
+                if found:
+                    return found
+                event = self._in_flight.get(key)
+                if event is None:
+                    self._in_flight[key] = threading.Event()
+                    break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not event.wait(remaining):
+                return self.BUSY, None
+
+        if not self.persist:
+            return self.NEW, None
+        try:
+            state, record = self._claim_persisted(key, fingerprint)
+        except Exception:
+            self._release(key)
+            raise
+        if state != self.NEW:
+            self._release(key)
+        return state, record
+
+    def _release(self, key: str):
+        with self._lock:
+            event = self._in_flight.pop(key, None)
+        if event:
+            event.set()
+
+    def complete(self, key: str, fingerprint: str, status: int, body):
+        """Store the response of a request started with begin()"""
+        try:
+            if status >= 500 or not (isinstance(body, dict) and body.get('success')):
+                # Failures are not remembered so the client's retry can succeed
+                if self.persist:
+                    self.db.execute_update("DELETE FROM idempotency_keys WHERE idem_key = %s", (key,))
+                return
+            with self._lock:
+                self._remember(key, fingerprint, status, body)
+            if self.persist:
+                self.db.execute_update(
+                    "UPDATE idempotency_keys SET status = %s, response = %s WHERE idem_key = %s",
+                    (status, json.dumps(body, default=json_default), key)
+                )
+        finally:
+            self._release(key)
+
+    def abort(self, key: str):
+        """Forget a request that failed before producing a response"""
+        try:
+            if self.persist:
+                self.db.execute_update("DELETE FROM idempotency_keys WHERE idem_key = %s", (key,))
+        finally:
+            self._release(key)
+
+    def purge_expired(self):
+        """Periodic job: delete persisted keys older than the TTL in small batches"""
+        if not self.persist:
+            return
+        query = "DELETE FROM idempotency_keys WHERE created_at < NOW() - INTERVAL %s SECOND LIMIT 1000"
+        while self.db.execute_update(query, (int(self.ttl),)) and self.db.get_last_rowcount() == 1000:
+            pass
@@ -14,5 +14,7 @@ from server import run_server
 
 # Run on port 8000 (or get from environment)
 port = int(os.getenv('PORT', 8000))
-run_server(port)
+# Serving mode from the command line, otherwise SERVER_MODE
+mode = sys.argv[1] if len(sys.argv) > 1 else None
+run_server(port, mode)
 
@@ -0,0 +1,32 @@
+"""
+Background jobs - periodic maintenance that runs inside the server process
+"""
+from typing import Callable
+import threading
+
+class PeriodicJob:
+    def __init__(self, name: str, interval: float, func: Callable):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.func()
+            except Exception as e:
+                print(f"Background job {self.name} failed: {e}")
+
+    def start(self):
+        """Start running func every interval seconds on a daemon thread"""
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"job-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Ask the job to stop after its current run"""
+        self._stop.set()
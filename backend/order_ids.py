@@ -0,0 +1,104 @@
+"""
+Order ID generators - produce the 10-character codes stored in orders.oid
+
+The default generator is time-ordered (snowflake style): a millisecond
+timestamp, a worker id and a per-millisecond sequence packed into 51 bits and
+written in base 36 with a fixed width. Only digits and upper-case letters are
+used: orders.oid is a PHP-created column under a case-insensitive collation,
+where 'a' equals 'A', so mixed-case codes would neither sort in creation order
+nor stay distinct in WHERE oid = %s lookups. With one letter case the order is
+the same under binary and case-insensitive collations, so later orders sort
+after earlier ones and new rows land at the right edge of the oid index
+instead of at random pages. Codes are unique as long as every process writing
+orders uses a distinct worker id, so there is no default: a generator without
+one refuses to produce codes.
+"""
+from typing import Optional
+import random
+import string
+import threading
+import time
+
+ALPHABET = string.digits + string.ascii_uppercase  # Same order in binary and case-insensitive collations
+BASE = len(ALPHABET)
+CODE_LENGTH = 10
+
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+WORKER_BITS = 6
+SEQUENCE_BITS = 4  # 16 codes per millisecond per worker; bursts borrow the next millisecond
+TIMESTAMP_BITS = 41  # ~69 years from EPOCH_MS; 41 + 6 + 4 bits fit in 10 base-36 digits
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+def encode_base36(value: int, length: int = CODE_LENGTH) -> str:
+    """Fixed-width base-36 encoding that preserves numeric order"""
+    chars = []
+    for _ in range(length):
+        value, remainder = divmod(value, BASE)
+        chars.append(ALPHABET[remainder])
+    if value:
+        raise ValueError("Value does not fit in the code length")
+    return ''.join(reversed(chars))
+
+def decode_base36(code: str) -> int:
+    """Inverse of encode_base36"""
+    value = 0
+    for char in code:
+        value = value * BASE + ALPHABET.index(char)
+    return value
+
+class TimeOrderedIdGenerator:
+    def __init__(self, worker_id: Optional[int]):
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._sequence = 0
+        self.worker_id = None
+        if worker_id is not None:
+            self.set_worker_id(worker_id)
+
+    def set_worker_id(self, worker_id: int):
+        """Assign the id that keeps this process's codes apart from every other process"""
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f"Order ID worker id must be between 0 and {MAX_WORKER_ID}")
+        self.worker_id = worker_id
+
+    def next_id(self) -> str:
+        """Next code; strictly increasing within this process even if the clock steps back"""
+        if self.worker_id is None:
+            raise RuntimeError("No order ID worker id assigned (set ORDER_ID_WORKER)")
+        with self._lock:
+            now_ms = int(time.time() * 1000) - EPOCH_MS
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            else:
+                # Same millisecond or clock moved backwards: keep counting from the last timestamp
+                self._sequence += 1
+                if self._sequence > MAX_SEQUENCE:
+                    self._last_ms += 1
+                    self._sequence = 0
+            value = (self._last_ms << (WORKER_BITS + SEQUENCE_BITS)) | (self.worker_id << SEQUENCE_BITS) | self._sequence
+        return encode_base36(value)
+
+class RandomIdGenerator:
+    """The original generator: random letters and digits, no ordering or uniqueness guarantee"""
+    def __init__(self, worker_id: Optional[int] = None):
+        self.worker_id = worker_id
+
+    def set_worker_id(self, worker_id: int):
+        self.worker_id = worker_id
+
+    def next_id(self) -> str:
+        chars = string.ascii_letters + string.digits
+        return ''.join(random.choice(chars) for _ in range(CODE_LENGTH))
+
+GENERATORS = {
+    'time': TimeOrderedIdGenerator,
+    'random': RandomIdGenerator
+}
+
+def create_generator(strategy: str, worker_id: Optional[int]):
+    """Build the generator selected by ORDER_ID_STRATEGY"""
+    if strategy not in GENERATORS:
+        raise ValueError(f"Unknown order ID strategy: {strategy}")
+    return GENERATORS[strategy](worker_id)
@@ -0,0 +1,104 @@
+"""
+Keyset pagination helpers
+
+A page is requested with ?limit=N and continued with ?after=<cursor>. The
+cursor is opaque to clients: URL-safe base64 of the last row's sort key plus
+a tag naming the ordering, so a cursor cannot be replayed against a different
+sort. Each page is fetched with a WHERE condition on the sort key instead of
+OFFSET, so page N costs the same as page 1, and every ordering ends with the
+row id so rows with equal sort values are never skipped or repeated.
+"""
+from .database import Database
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import base64
+import binascii
+import json
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+# (SQL expression, 'ASC' or 'DESC', key of the value in the result row)
+SortColumn = Tuple[str, str, str]
+
+def parse_page_params(query: Dict) -> Tuple[Optional[int], Optional[str]]:
+    """Read limit/after from query parameters; (None, None) means no pagination.
+
+    Raises ValueError for a limit that is not a positive integer.
+    """
+    limit = query.get('limit')
+    after = query.get('after') or None
+    if limit is None:
+        return (DEFAULT_PAGE_SIZE, after) if after else (None, None)
+    try:
+        limit = int(limit)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+    return min(limit, MAX_PAGE_SIZE), after
+
+def encode_cursor(tag: str, values: Sequence) -> str:
+    raw = json.dumps({'s': tag, 'k': list(values)}, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(tag: str, cursor: str) -> List:
+    """Sort key values from a cursor; raises ValueError if it is malformed or for another ordering"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw)
+    except (binascii.Error, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(data, dict) or data.get('s') != tag or not isinstance(data.get('k'), list):
+        raise ValueError("Invalid cursor")
+    return data['k']
+
+def _tag(columns: List[SortColumn]) -> str:
+    return ','.join(f"{expr} {direction}" for expr, direction, _ in columns)
+
+def _keyset_condition(columns: List[SortColumn], values: List) -> Tuple[str, List]:
+    """(a > x) OR (a = x AND b > y) ... with > or < per column direction"""
+    if len(values) != len(columns):
+        raise ValueError("Invalid cursor")
+    clauses = []
+    params = []
+    for index, (expr, direction, _) in enumerate(columns):
+        parts = [f"{columns[i][0]} = %s" for i in range(index)]
+        parts.append(f"{expr} {'<' if direction == 'DESC' else '>'} %s")
+        clauses.append('(' + ' AND '.join(parts) + ')')
+        params.extend(values[:index + 1])
+    return '(' + ' OR '.join(clauses) + ')', params
+
+def fetch_page(db: Database, query: str, params: List, columns: List[SortColumn],
+               limit: int, after: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    """Run query (which must end in a WHERE clause) for one page.
+
+    Returns the rows and the cursor for the next page, or None on the last page.
+    """
+    tag = _tag(columns)
+    params = list(params)
+    if after:
+        condition, values = _keyset_condition(columns, decode_cursor(tag, after))
+        query += f" AND {condition}"
+        params.extend(values)
+    query += " ORDER BY " + ', '.join(f"{expr} {direction}" for expr, direction, _ in columns)
+    query += " LIMIT %s"
+    params.append(limit + 1)
+    rows = db.execute_query(query, tuple(params)) or []
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(tag, [rows[-1][key] for _, _, key in columns])
+
+def paginate_rows(rows: List[Dict], key: Callable[[Dict], List], tag: str,
+                  limit: int, after: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    """Keyset-paginate an in-memory list already sorted by key (ascending)"""
+    if after:
+        last = decode_cursor(tag, after)
+        try:
+            rows = [row for row in rows if key(row) > last]
+        except TypeError as e:
+            raise ValueError("Invalid cursor") from e
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(tag, key(rows[-1]))
@@ -0,0 +1,47 @@
+"""
+Field projection for listing endpoints
+
+Listings accept ?fields=a,b,c naming the columns to return. Each endpoint
+declares the fields it exposes as a mapping of field name to SQL expression,
+so only whitelisted columns can ever be selected and columns such as
+users.password are never part of a result set.
+"""
+from typing import Dict, List, Optional, Sequence
+
+def parse_fields(query: Dict, columns: Dict[str, str], default: Optional[Sequence[str]] = None) -> Optional[List[str]]:
+    """Fields requested with fields=, or default when the parameter is absent.
+
+    Raises ValueError for a field the endpoint does not expose.
+    """
+    raw = query.get('fields')
+    if not raw:
+        return list(default) if default is not None else None
+    fields = []
+    for name in raw.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in columns:
+            raise ValueError(f"Unknown field: {name}")
+        if name not in fields:
+            fields.append(name)
+    if not fields:
+        raise ValueError("fields must name at least one field")
+    return fields
+
+def with_required(fields: Sequence[str], required: Sequence[str]) -> List[str]:
+    """fields plus any required ones (ids, sort keys) that are missing"""
+    return list(fields) + [name for name in required if name not in fields]
+
+def select_list(columns: Dict[str, str], fields: Sequence[str]) -> str:
+    """SQL select list for fields, aliasing expressions to their field names"""
+    return ', '.join(
+        columns[name] if columns[name] == name else f"{columns[name]} AS {name}"
+        for name in fields
+    )
+
+def project(rows: List[Dict], fields: Optional[Sequence[str]]) -> List[Dict]:
+    """Keep only fields in rows that are already in memory (None keeps everything)"""
+    if fields is None:
+        return rows
+    return [{name: row[name] for name in fields if name in row} for row in rows]
@@ -0,0 +1,117 @@
+"""
+Declarative request router
+
+Routes are registered as an HTTP method plus a path template such as
+'/api/user/{user_id:int}' and compiled into a trie of path segments, so
+dispatch costs one dictionary lookup per segment regardless of how many
+routes exist. Static segments always win over parameters, which removes
+the ordering ambiguities of hand-written startswith/endswith chains.
+"""
+import urllib.parse
+from typing import Callable, Dict, List, Optional, Tuple
+
+def _to_int(segment: str) -> Optional[int]:
+    """Convert an integer path segment, or None if it is not one"""
+    digits = segment[1:] if segment.startswith('-') else segment
+    if digits.isascii() and digits.isdigit():
+        return int(segment)
+    return None
+
+def _to_str(segment: str) -> Optional[str]:
+    """Decode a string path segment"""
+    return urllib.parse.unquote(segment)
+
+# Converter name -> function returning the converted value or None on mismatch.
+# Listed in matching priority: stricter converters are tried first.
+CONVERTERS = {
+    'int': _to_int,
+    'str': _to_str
+}
+
+class _Node:
+    __slots__ = ('static', 'params', 'handlers')
+
+    def __init__(self):
+        self.static: Dict[str, '_Node'] = {}
+        self.params: List[Tuple[str, '_Node']] = []  # (converter, child)
+        self.handlers: Dict[str, Tuple[Callable, List[str]]] = {}  # method -> (handler, parameter names)
+
+class Router:
+    def __init__(self):
+        self.root = _Node()
+
+    @staticmethod
+    def _split(path: str) -> List[str]:
+        return [segment for segment in path.split('/') if segment]
+
+    def add(self, method: str, template: str, handler: Callable):
+        """Register handler for method and path template"""
+        node = self.root
+        names = []
+        for segment in self._split(template):
+            if segment.startswith('{') and segment.endswith('}'):
+                name, _, converter = segment[1:-1].partition(':')
+                converter = converter or 'str'
+                if converter not in CONVERTERS:
+                    raise ValueError(f"Unknown path converter '{converter}' in {template}")
+                names.append(name)
+                for param_converter, child in node.params:
+                    if param_converter == converter:
+                        node = child
+                        break
+                else:
+                    child = _Node()
+                    node.params.append((converter, child))
+                    node.params.sort(key=lambda param: list(CONVERTERS).index(param[0]))
+                    node = child
+            else:
+                node = node.static.setdefault(segment, _Node())
+        method = method.upper()
+        if method in node.handlers:
+            raise ValueError(f"Duplicate route: {method} {template}")
+        node.handlers[method] = (handler, names)
+
+    def route(self, method: str, template: str):
+        """Decorator form of add()"""
+        def decorator(handler: Callable) -> Callable:
+            self.add(method, template, handler)
+            return handler
+        return decorator
+
+    def _match(self, node: _Node, segments: List[str], index: int, values: List, method: str, allowed: set):
+        if index == len(segments):
+            if method in node.handlers:
+                handler, names = node.handlers[method]
+                return handler, dict(zip(names, values))
+            allowed.update(node.handlers)
+            return None
+        segment = segments[index]
+        child = node.static.get(segment)
+        if child is not None:
+            found = self._match(child, segments, index + 1, values, method, allowed)
+            if found:
+                return found
+        for converter, child in node.params:
+            value = CONVERTERS[converter](segment)
+            if value is None:
+                continue
+            values.append(value)
+            found = self._match(child, segments, index + 1, values, method, allowed)
+            values.pop()
+            if found:
+                return found
+        return None
+
+    def resolve(self, method: str, path: str) -> Tuple[int, Optional[Callable], Dict]:
+        """Find the handler for a request.
+
+        Returns (200, handler, params) on a match, (405, None, {'allow': [...]})
+        when the path exists under other methods, and (404, None, {}) otherwise.
+        """
+        allowed = set()
+        found = self._match(self.root, self._split(path), 0, [], method.upper(), allowed)
+        if found:
+            return 200, found[0], found[1]
+        if allowed:
+            return 405, None, {'allow': sorted(allowed)}
+        return 404, None, {}
@@ -1,11 +1,15 @@
 """
 Simple startup script for the Python HTTP server
 Run this on Hostinger: python start.py
+Optionally pick the serving mode: python start.py [single|threaded|prefork|asyncio]
 """
 from server import run_server
 import os
+import sys
 
 # Get port from environment or use default
 port = int(os.getenv('PORT', 8000))
-run_server(port)
+# Serving mode from the command line, otherwise SERVER_MODE
+mode = sys.argv[1] if len(sys.argv) > 1 else None
+run_server(port, mode)
 
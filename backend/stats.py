@@ -0,0 +1,189 @@
+"""
+Dashboard statistics - in-process counters maintained incrementally
+
+The counters are seeded from one grouped query (orders per status, users per
+type, product count) and then kept current by the APIs that create, update
+or delete orders, users and products, so a dashboard read is O(1) no matter
+how large the order history grows. A periodic reconciliation reseeds them to
+correct any drift, and changes are published on the invalidation bus so other
+worker processes reseed their copy. Orders and status changes made by the PHP
+web system reach neither, so a read also reseeds counters older than max_age
+seconds.
+"""
+from .database import Database
+from .invalidation import InvalidationBus
+from typing import Dict, Optional
+from decimal import Decimal
+import threading
+import time
+
+def _decimal(value) -> Decimal:
+    return Decimal(str(value)) if value is not None else Decimal('0')
+
+class DashboardStats:
+    BUS_NAME = 'stats'
+
+    def __init__(self, db: Database, bus: Optional[InvalidationBus] = None, max_age: float = 0):
+        self.db = db
+        self.bus = bus
+        self.max_age = max_age  # Seconds before a read reseeds, 0 disables
+        self._lock = threading.Lock()
+        self._orders_by_status: Dict[str, int] = {}
+        self._value_by_status: Dict[str, Decimal] = {}
+        self._users_by_type: Dict[str, int] = {}
+        self._total_products = 0
+        self._seeded = False
+        self._seeded_at = 0.0
+        self._generation = 0  # Bumped on every change so a slow seed cannot overwrite newer counts
+        if bus is not None:
+            bus.subscribe(self.BUS_NAME, self._mark_stale)
+
+    def seed(self) -> bool:
+        """Load every counter from the database in one grouped query"""
+        query = """
+            SELECT 'orders' AS kind, payment_status AS bucket, COUNT(*) AS total, SUM(total_price) AS value
+            FROM orders GROUP BY payment_status
+            UNION ALL
+            SELECT 'users', user_type, COUNT(*), NULL FROM users GROUP BY user_type
+            UNION ALL
+            SELECT 'products', NULL, COUNT(*), NULL FROM products
+        """
+        generation = self._generation
+        started = time.monotonic()
+        result = self.db.execute_query(query)
+        if result is None:
+            return False
+
+        orders_by_status = {}
+        value_by_status = {}
+        users_by_type = {}
+        total_products = 0
+        for row in result:
+            if row['kind'] == 'orders':
+                orders_by_status[row['bucket']] = int(row['total'])
+                value_by_status[row['bucket']] = _decimal(row['value'])
+            elif row['kind'] == 'users':
+                users_by_type[row['bucket']] = int(row['total'])
+            else:
+                total_products = int(row['total'])
+
+        with self._lock:
+            if generation != self._generation:
+                return False  # Counters changed while the query ran; the next read reseeds
+            self._orders_by_status = orders_by_status
+            self._value_by_status = value_by_status
+            self._users_by_type = users_by_type
+            self._total_products = total_products
+            self._seeded = True
+            self._seeded_at = started
+        return True
+
+    def reconcile(self):
+        """Periodic job: reseed the counters to correct any drift"""
+        self.seed()
+
+    def _mark_stale(self):
+        """Reseed on next read (another process changed the data)"""
+        with self._lock:
+            self._generation += 1
+            self._seeded = False
+
+    def _expired(self) -> bool:
+        """Whether the counters are past max_age; only the first caller to notice gets True"""
+        if not self.max_age or not self._seeded:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if now - self._seeded_at < self.max_age:
+                return False
+            self._seeded_at = now  # Other readers keep the current counts while this one reseeds
+            return True
+
+    def _ensure_seeded(self):
+        if self.bus is not None:
+            self.bus.poll()
+        if self._expired():
+            self.seed()  # On failure the current counts are kept
+        # A write racing the seed makes it back off; one retry is enough in practice
+        if not self._seeded and not self.seed():
+            self.seed()
+
+    def _publish(self):
+        if self.bus is not None:
+            self.bus.publish(self.BUS_NAME)
+
+    # Reads
+    def admin_stats(self) -> Dict:
+        """Counters shown on the admin dashboard"""
+        self._ensure_seeded()
+        with self._lock:
+            return {
+                'pending_orders': self._orders_by_status.get('pending', 0),
+                'total_orders': sum(self._orders_by_status.values()),
+                'completed_orders': self._orders_by_status.get('completed_confirmed', 0),
+                'total_products': self._total_products,
+                'total_users': sum(self._users_by_type.values()),
+                'total_admins': self._users_by_type.get('admin', 0),
+                'total_staff': self._users_by_type.get('staff', 0)
+            }
+
+    def staff_stats(self) -> Dict:
+        """Counters shown on the staff dashboard"""
+        self._ensure_seeded()
+        with self._lock:
+            return {
+                'pending_orders': self._orders_by_status.get('pending', 0),
+                'total_orders': sum(self._orders_by_status.values()),
+                'completed_orders': self._orders_by_status.get('completed_confirmed', 0),
+                'completed_value': float(self._value_by_status.get('completed', 0)),
+                'total_products': self._total_products
+            }
+
+    # Incremental updates, called after the corresponding write succeeded
+    def _adjust_orders(self, status: str, count: int, value):
+        self._orders_by_status[status] = self._orders_by_status.get(status, 0) + count
+        self._value_by_status[status] = self._value_by_status.get(status, Decimal('0')) + count * _decimal(value)
+
+    def order_created(self, total_price, status: str = 'pending'):
+        with self._lock:
+            self._generation += 1
+            self._adjust_orders(status, 1, total_price)
+        self._publish()
+
+    def order_status_changed(self, old_status: str, new_status: str, total_price):
+        if old_status == new_status:
+            return
+        with self._lock:
+            self._generation += 1
+            self._adjust_orders(old_status, -1, total_price)
+            self._adjust_orders(new_status, 1, total_price)
+        self._publish()
+
+    def order_deleted(self, status: str, total_price):
+        with self._lock:
+            self._generation += 1
+            self._adjust_orders(status, -1, total_price)
+        self._publish()
+
+    def user_added(self, user_type: str):
+        with self._lock:
+            self._generation += 1
+            self._users_by_type[user_type] = self._users_by_type.get(user_type, 0) + 1
+        self._publish()
+
+    def product_added(self):
+        with self._lock:
+            self._generation += 1
+            self._total_products += 1
+        self._publish()
+
+    def product_deleted(self):
+        with self._lock:
+            self._generation += 1
+            self._total_products -= 1
+        self._publish()
+
+    def invalidate(self):
+        """Reseed on next read, for bulk changes that are not worth tracking row by row"""
+        self._mark_stale()
+        self._publish()
@@ -0,0 +1,444 @@
+"""
+Write-behind cart store - keeps active carts in process memory
+
+Carts are written constantly and live for minutes, so with CART_ENGINE=memory
+cart reads and writes are served from memory and only the changes are written
+to the cart table, in batches, by a periodic flush. Every change is first
+appended to a local JSON-lines journal; the journal is rotated into a numbered
+segment when a flush starts and the segment is deleted once the flush commits,
+so after a crash the changes that never reached MySQL are replayed at startup.
+If a flush fails, each user's changes are retried on their own: changes MySQL
+rejects as bad data are dropped (and that cart is reloaded) instead of holding
+back every other cart, while a connection failure keeps everything for the
+next flush.
+
+The store assumes it is the only writer of the cart table (one server process,
+not prefork), because other writers' changes to a loaded cart would be
+overwritten. Lines added in memory get negative provisional ids until they are
+flushed; the provisional id keeps working after the real one is known.
+"""
+from .database import Database
+from mysql.connector.errors import DataError, IntegrityError
+from typing import Dict, Iterable, List, Optional, Tuple
+from decimal import Decimal
+import glob
+import itertools
+import json
+import os
+import threading
+import time
+
+BATCH_ROWS = 500  # Rows per multi-row statement
+# Columns of a cart line as the API returns it; bookkeeping columns such as updated_at stay out
+CART_SELECT = "id, user_id, pid, name, price, quantity, image"
+
+def _chunks(items: List, size: int = BATCH_ROWS) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _bad_data(error: Exception) -> bool:
+    """Whether a failed write will fail again however often it is retried"""
+    return isinstance(error, (DataError, IntegrityError, TypeError, ValueError, ArithmeticError))
+
+class _Changes:
+    """Pending cart changes, compacted so each (user_id, pid) appears once"""
+    def __init__(self):
+        self.cleared = set()  # user ids whose whole cart is deleted first
+        self.removed = set()  # (user_id, pid) lines to delete
+        self.lines: Dict[Tuple[int, int], Dict] = {}  # (user_id, pid) -> full line to upsert
+
+    def __bool__(self):
+        return bool(self.cleared or self.removed or self.lines)
+
+    def set_line(self, line: Dict):
+        key = (line['user_id'], line['pid'])
+        self.removed.discard(key)
+        self.lines[key] = dict(line)
+
+    def remove(self, user_id: int, pid: int):
+        key = (user_id, pid)
+        self.lines.pop(key, None)
+        self.removed.add(key)
+
+    def clear(self, user_id: int):
+        self.lines = {key: line for key, line in self.lines.items() if key[0] != user_id}
+        self.removed = {key for key in self.removed if key[0] != user_id}
+        self.cleared.add(user_id)
+
+    def merge(self, newer: '_Changes'):
+        """Apply changes made after these ones on top of them"""
+        for user_id in newer.cleared:
+            self.clear(user_id)
+        for user_id, pid in newer.removed:
+            self.remove(user_id, pid)
+        for line in newer.lines.values():
+            self.set_line(line)
+
+    def users(self) -> set:
+        return self.cleared | {key[0] for key in self.removed} | {key[0] for key in self.lines}
+
+    def for_user(self, user_id: int) -> '_Changes':
+        """The part of these changes that belongs to one user"""
+        changes = _Changes()
+        if user_id in self.cleared:
+            changes.cleared.add(user_id)
+        changes.removed = {key for key in self.removed if key[0] == user_id}
+        changes.lines = {key: line for key, line in self.lines.items() if key[0] == user_id}
+        return changes
+
+    def apply_record(self, record: Dict):
+        """Replay one journal record"""
+        if record['op'] == 'set':
+            self.set_line(record['line'])
+        elif record['op'] == 'remove':
+            self.remove(record['user_id'], record['pid'])
+        elif record['op'] == 'clear':
+            self.clear(record['user_id'])
+
+    def overlay(self, user_id: int, lines: Dict[int, Dict]):
+        """Apply the changes for one user to that user's lines (pid -> line)"""
+        if user_id in self.cleared:
+            lines.clear()
+        for key in self.removed:
+            if key[0] == user_id:
+                lines.pop(key[1], None)
+        for key, line in self.lines.items():
+            if key[0] == user_id:
+                lines[key[1]] = dict(line)
+
+class WriteBehindCartStore:
+    def __init__(self, db: Database, journal_path: str, idle_timeout: float = 1800):
+        self.db = db
+        self.journal_path = journal_path
+        self.idle_timeout = idle_timeout
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._carts: Dict[int, Dict[int, Dict]] = {}  # user_id -> pid -> line
+        self._touched: Dict[int, float] = {}  # user_id -> last access
+        self._ids: Dict[int, Tuple[int, int]] = {}  # cart id (real or provisional) -> (user_id, pid)
+        self._key_ids: Dict[Tuple[int, int], List[int]] = {}  # (user_id, pid) -> every id it is known by
+        self._changes = _Changes()  # Not yet flushed
+        self._inflight: Optional[_Changes] = None  # Being flushed right now
+        self._provisional = itertools.count(-1, -1)
+        self._segment = 0
+        self._journal = None
+
+    # Id bookkeeping (caller holds the lock)
+    def _remember(self, cart_id: int, key: Tuple[int, int]):
+        if self._ids.get(cart_id) != key:
+            self._ids[cart_id] = key
+            self._key_ids.setdefault(key, []).append(cart_id)
+
+    def _forget(self, key: Tuple[int, int]):
+        for cart_id in self._key_ids.pop(key, []):
+            self._ids.pop(cart_id, None)
+
+    # Journal
+    def _segments(self) -> List[Tuple[int, str]]:
+        segments = []
+        for path in glob.glob(glob.escape(self.journal_path) + '.*'):
+            suffix = path[len(self.journal_path) + 1:]
+            if suffix.isdigit():
+                segments.append((int(suffix), path))
+        return sorted(segments)
+
+    def _open_journal(self):
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+    def _record(self, record: Dict):
+        """Journal a change, then queue it for the next flush (caller holds the lock)"""
+        self._open_journal()
+        self._journal.write(json.dumps(record, default=str) + '\n')
+        self._journal.flush()  # Survives a process crash; fsync happens at each flush
+        self._changes.apply_record(record)
+
+    def _rotate(self) -> int:
+        """Move the live journal to a new numbered segment (caller holds the lock)"""
+        if self._journal is not None:
+            os.fsync(self._journal.fileno())
+            self._journal.close()
+            self._journal = None
+        self._segment += 1
+        if os.path.exists(self.journal_path):
+            os.replace(self.journal_path, f"{self.journal_path}.{self._segment}")
+        return self._segment
+
+    def recover(self) -> bool:
+        """Replay journals left by a previous run and flush them; call once before serving"""
+        with self._lock:
+            changes = _Changes()
+            segments = self._segments()
+            paths = [path for _, path in segments]
+            if os.path.exists(self.journal_path):
+                paths.append(self.journal_path)
+            count = 0
+            for path in paths:
+                with open(path, encoding='utf-8') as journal:
+                    for entry in journal:
+                        try:
+                            record = json.loads(entry)
+                            if record['op'] == 'set':
+                                # The journal stores prices as strings
+                                record['line']['price'] = Decimal(str(record['line']['price']))
+                            changes.apply_record(record)
+                        except (ValueError, KeyError, ArithmeticError):
+                            continue  # Torn last line from a crash mid-write
+                        count += 1
+            changes.merge(self._changes)
+            self._changes = changes
+            self._segment = segments[-1][0] if segments else 0
+            # Keep provisional ids from the journal unique
+            lowest = min([line['id'] for line in changes.lines.values() if line.get('id', 0) < 0], default=0)
+            self._provisional = itertools.count(lowest - 1, -1)
+        if count:
+            print(f"Replaying {count} journalled cart changes")
+        return self.flush()
+
+    # Loading
+    def _load(self, user_id: int) -> Optional[Dict[int, Dict]]:
+        """Return the user's lines (pid -> line), loading them from the database if needed"""
+        with self._lock:
+            lines = self._carts.get(user_id)
+            if lines is not None:
+                self._touched[user_id] = time.monotonic()
+                return lines
+        rows = self.db.execute_query(f"SELECT {CART_SELECT} FROM cart WHERE user_id = %s", (user_id,))
+        if rows is None:
+            return None
+        with self._lock:
+            if user_id not in self._carts:
+                lines = {row['pid']: row for row in rows}
+                # Changes that have not reached the database yet win over what it returned
+                if self._inflight is not None:
+                    self._inflight.overlay(user_id, lines)
+                self._changes.overlay(user_id, lines)
+                for pid, line in lines.items():
+                    if line.get('id') is None:
+                        line['id'] = next(self._provisional)
+                    self._remember(line['id'], (user_id, pid))
+                self._carts[user_id] = lines
+            self._touched[user_id] = time.monotonic()
+            return self._carts[user_id]
+
+    def _locate(self, cart_id: int) -> Optional[Tuple[int, int]]:
+        """(user_id, pid) for a cart line id, loading the owner's cart if needed"""
+        with self._lock:
+            key = self._ids.get(cart_id)
+        if key is None and cart_id > 0:
+            result = self.db.execute_query("SELECT user_id FROM cart WHERE id = %s", (cart_id,))
+            if result and self._load(result[0]['user_id']) is not None:
+                with self._lock:
+                    key = self._ids.get(cart_id)
+        return key
+
+    # Reads
+    def get_cart(self, user_id: int) -> Optional[List[Dict]]:
+        """Copies of the user's cart lines, or None on a database error"""
+        lines = self._load(user_id)
+        if lines is None:
+            return None
+        with self._lock:
+            return [dict(line) for line in lines.values()]
+
+    # Writes (caller holds the lock for the _set/_remove helpers)
+    def _set(self, line: Dict):
+        self._carts[line['user_id']][line['pid']] = line
+        self._remember(line['id'], (line['user_id'], line['pid']))
+        self._record({'op': 'set', 'line': line})
+
+    def _remove(self, user_id: int, pid: int):
+        self._carts[user_id].pop(pid, None)
+        self._forget((user_id, pid))
+        self._record({'op': 'remove', 'user_id': user_id, 'pid': pid})
+
+    def _add(self, user_id: int, product_id: int, quantity: int, product_data: Dict) -> bool:
+        lines = self._carts[user_id]
+        existing = lines.get(product_id)
+        if existing is not None:
+            self._set({**existing, 'quantity': existing['quantity'] + quantity})
+            return False
+        self._set({
+            'id': next(self._provisional),
+            'user_id': user_id,
+            'pid': product_id,
+            'name': product_data['name'],
+            'price': product_data['price'],
+            'quantity': quantity,
+            'image': product_data['image']
+        })
+        return True
+
+    def add(self, user_id: int, product_id: int, quantity: int, product_data: Dict) -> Optional[bool]:
+        """Add to a line; True if the line is new, False if it existed, None on a database error"""
+        if self._load(user_id) is None:
+            return None
+        with self._lock:
+            return self._add(user_id, product_id, quantity, product_data)
+
+    def set_quantity(self, cart_id: int, quantity: int) -> bool:
+        """Change a line's quantity; False if the line does not exist"""
+        key = self._locate(cart_id)
+        with self._lock:
+            line = self._carts.get(key[0], {}).get(key[1]) if key else None
+            if line is None:
+                return False
+            self._set({**line, 'quantity': quantity})
+            return True
+
+    def remove(self, cart_id: int) -> bool:
+        """Remove a line; False if it does not exist"""
+        key = self._locate(cart_id)
+        with self._lock:
+            if not key or key[1] not in self._carts.get(key[0], {}):
+                return False
+            self._remove(*key)
+            return True
+
+    def clear(self, user_id: int):
+        """Empty a user's cart (also used at checkout, after the order committed)"""
+        with self._lock:
+            for pid in self._carts.get(user_id, {}):
+                self._forget((user_id, pid))
+            self._carts[user_id] = {}
+            self._touched[user_id] = time.monotonic()
+            self._record({'op': 'clear', 'user_id': user_id})
+
+    def apply_batch(self, user_id: int, operations: List[Dict]) -> Optional[List[Dict]]:
+        """Apply validated batch operations with CartAPI.apply_batch semantics; returns the final cart"""
+        lines = self._load(user_id)
+        if lines is None:
+            return None
+        with self._lock:
+            by_id = {cart_id: pid for pid in lines for cart_id in self._key_ids.get((user_id, pid), [])}
+            for op in operations:
+                pid = by_id.get(op.get('cart_id'))
+                if op['op'] == 'update' and pid in lines:
+                    self._set({**lines[pid], 'quantity': op.get('quantity', 1)})
+            for op in operations:
+                pid = by_id.get(op.get('cart_id'))
+                if op['op'] == 'remove' and pid in lines:
+                    self._remove(user_id, pid)
+            for op in operations:
+                if op['op'] == 'add':
+                    self._add(user_id, op['product_id'], op.get('quantity', 1), op['product_data'])
+            return [dict(line) for line in lines.values()]
+
+    # Flushing
+    def flush(self) -> bool:
+        """Write pending changes to the cart table in one transaction"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._changes:
+                    self._evict_idle()
+                    return True
+                changes, self._changes = self._changes, _Changes()
+                self._inflight = changes
+                segment = self._rotate()
+            dropped = set()
+            try:
+                ids = self._write(changes)
+                retry = None
+            except Exception as e:
+                print(f"Error flushing carts: {e}")
+                ids, retry, dropped = self._write_each(changes)
+            with self._lock:
+                self._inflight = None
+                if retry:
+                    retry.merge(self._changes)
+                    self._changes = retry
+                for user_id in dropped:
+                    # Reload what MySQL actually holds for this cart on the next read
+                    if user_id not in self._changes.users():
+                        for pid in self._carts.pop(user_id, {}):
+                            self._forget((user_id, pid))
+                        self._touched.pop(user_id, None)
+                for row in ids:
+                    key = (row['user_id'], row['pid'])
+                    line = self._carts.get(key[0], {}).get(key[1])
+                    if line is not None:
+                        line['id'] = row['id']  # The provisional id keeps resolving too
+                        self._remember(row['id'], key)
+                self._evict_idle()
+            if retry:
+                return False  # Journal segments are kept until the retried changes are written
+            for number, path in self._segments():
+                if number <= segment:
+                    os.remove(path)
+            return True
+
+    def _write(self, changes: _Changes) -> List[Dict]:
+        """Run the batched statements; returns the real ids of the upserted lines"""
+        lines = list(changes.lines.values())
+        with self.db.transaction() as cursor:
+            for users in _chunks(sorted(changes.cleared)):
+                placeholders = ', '.join(['%s'] * len(users))
+                cursor.execute(f"DELETE FROM cart WHERE user_id IN ({placeholders})", tuple(users))
+            for keys in _chunks(sorted(changes.removed)):
+                placeholders = ', '.join(['(%s, %s)'] * len(keys))
+                cursor.execute(
+                    f"DELETE FROM cart WHERE (user_id, pid) IN ({placeholders})",
+                    tuple(value for key in keys for value in key)
+                )
+            for rows in _chunks(lines):
+                placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(rows))
+                cursor.execute(
+                    f"""
+                    INSERT INTO cart (user_id, pid, name, price, quantity, image)
+                    VALUES {placeholders}
+                    ON DUPLICATE KEY UPDATE name = VALUES(name), price = VALUES(price),
+                        quantity = VALUES(quantity), image = VALUES(image)
+                    """,
+                    tuple(value for line in rows for value in (
+                        line['user_id'], line['pid'], line['name'], line['price'], line['quantity'], line['image']
+                    ))
+                )
+            ids = []
+            for users in _chunks(sorted({line['user_id'] for line in lines})):
+                placeholders = ', '.join(['%s'] * len(users))
+                cursor.execute(f"SELECT id, user_id, pid FROM cart WHERE user_id IN ({placeholders})", tuple(users))
+                ids.extend(cursor.fetchall())
+        return ids
+
+    def _write_each(self, changes: _Changes) -> Tuple[List[Dict], Optional[_Changes], set]:
+        """Write changes one user at a time after the batched write failed.
+
+        Returns the ids written, the changes to retry (None if nothing is left)
+        and the users whose changes were dropped as bad data. The first failure
+        that is not bad data (MySQL unreachable) stops the loop and everything
+        not yet written is kept for the next flush.
+        """
+        ids = []
+        retry = _Changes()
+        dropped = set()
+        users = sorted(changes.users())
+        for index, user_id in enumerate(users):
+            part = changes.for_user(user_id)
+            try:
+                ids.extend(self._write(part))
+            except Exception as e:
+                if not _bad_data(e):
+                    for remaining in users[index:]:
+                        retry.merge(changes.for_user(remaining))
+                    break
+                print(f"Dropping unwritable cart changes for user {user_id}: {e}")
+                dropped.add(user_id)
+        return ids, (retry or None), dropped
+
+    def _evict_idle(self):
+        """Forget carts nobody touched for idle_timeout and that have nothing pending (caller holds the lock)"""
+        cutoff = time.monotonic() - self.idle_timeout
+        pending = {key[0] for key in itertools.chain(self._changes.lines, self._changes.removed)} | self._changes.cleared
+        for user_id, touched in list(self._touched.items()):
+            if touched < cutoff and user_id not in pending:
+                for pid in self._carts.pop(user_id, {}):
+                    self._forget((user_id, pid))
+                del self._touched[user_id]
+
+    def close(self):
+        """Flush and close the journal (call on shutdown)"""
+        self.flush()
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
@@ -0,0 +1,308 @@
+"""
+Product catalog cache - keeps the products table in process memory
+
+The menu changes a few times a day but is read on almost every request, so
+the whole table is loaded once and indexed by id, category and sort order.
+Admin and staff product mutations patch or invalidate the cache right after
+their write succeeds and publish the change on the invalidation bus, so
+other worker processes drop their copy. Writes that bypass both (the PHP web
+system shares these tables) are picked up by reloading the table once a
+snapshot is older than max_age seconds. Ordering and matching mirror the
+MySQL queries the APIs used to run (case-insensitive, NULL categories first).
+
+Given a render function, each snapshot also keeps the encoded response body
+of every unfiltered listing (per sort_by mode and per category) once it has
+been served, so those requests skip sorting and JSON encoding. A product
+change carries over the bodies of the category views it did not touch.
+"""
+from .database import Database
+from .invalidation import InvalidationBus
+from .search_index import TrigramIndex
+from .product_search import ProductSearchEngine
+from typing import Callable, Optional, List, Dict, Tuple
+import functools
+import threading
+import time
+
+# sort_by modes that filter on a category, as used by ProductAPI.get_all_products
+SORT_CATEGORIES = {
+    'affordable': 'Affordable',
+    'best_seller': 'Best seller',
+    'combo_meal': 'Combo meal'
+}
+
+def _fold(value) -> str:
+    """Normalize a string the way MySQL's case-insensitive collation compares it"""
+    return (value or '').rstrip().casefold()
+
+def _category_key(product: Dict):
+    # ORDER BY category ASC puts NULL first
+    return (product.get('category') is not None, _fold(product.get('category')))
+
+def sort_key(sort_by: str) -> Callable[[Dict], List]:
+    """Ascending key matching the order of _Snapshot.sorted_view(sort_by), for keyset pagination"""
+    if sort_by == 'all':
+        return lambda product: [*_category_key(product), -product['id']]
+    if sort_by == 'oldest':
+        return lambda product: [product['id']]
+    return lambda product: [-product['id']]
+
+def _listing_key(sort_by: str) -> Tuple[str, Optional[str]]:
+    """(view, folded category it depends on or None for the whole menu) for a sort_by mode"""
+    if sort_by in SORT_CATEGORIES:
+        return sort_by, _fold(SORT_CATEGORIES[sort_by])
+    return ('all' if sort_by == 'all' else 'oldest' if sort_by == 'oldest' else 'newest'), None
+
+class _Snapshot:
+    """Immutable indexes over one version of the products table"""
+    def __init__(self, rows: List[Dict]):
+        self.by_id = {row['id']: row for row in rows}
+        self._by_name: Dict[str, List[Dict]] = {}
+        self._responses: Dict[Tuple[str, Optional[str]], bytes] = {}
+        newest = sorted(rows, key=lambda row: row['id'], reverse=True)
+        self.newest = newest
+        self.oldest = newest[::-1]
+        # ORDER BY category ASC, id DESC (sorted is stable, so id DESC is kept within a category)
+        self.by_category_then_newest = sorted(newest, key=_category_key)
+        self.by_category: Dict[str, List[Dict]] = {}
+        for row in newest:
+            self.by_category.setdefault(_fold(row.get('category')), []).append(row)
+        categories = {}
+        for row in self.by_category_then_newest:
+            category = row.get('category')
+            if category and category.strip() and _fold(category) != _fold('Out of stock'):
+                categories.setdefault(_fold(category), category)
+        self.categories = list(categories.values())
+
+    @functools.cached_property
+    def name_index(self) -> TrigramIndex:
+        """Trigram index over product names, built on the first search of this snapshot"""
+        index = TrigramIndex()
+        for row in self.by_id.values():
+            index.add(row['id'], row.get('name'))
+        return index
+
+    @functools.cached_property
+    def search_engine(self) -> ProductSearchEngine:
+        """Ranked, typo-tolerant search over this snapshot, built on first use"""
+        return ProductSearchEngine(list(self.by_id.values()))
+
+    def sorted_view(self, sort_by: str) -> List[Dict]:
+        """Rows in the order ProductAPI.get_all_products returns them"""
+        if sort_by == 'all':
+            return self.by_category_then_newest
+        if sort_by == 'oldest':
+            return self.oldest
+        if sort_by in SORT_CATEGORIES:
+            return self.by_category.get(_fold(SORT_CATEGORIES[sort_by]), [])
+        return self.newest  # 'newest' and unknown modes
+
+    def by_name(self, category: str) -> List[Dict]:
+        """Rows in a category ordered by name"""
+        folded = _fold(category)
+        rows = self._by_name.get(folded)
+        if rows is None:
+            rows = sorted(self.by_category.get(folded, []), key=lambda row: _fold(row.get('name')))
+            self._by_name[folded] = rows
+        return rows
+
+    def response(self, key: Tuple[str, Optional[str]], rows: Callable[[], List[Dict]],
+                 render: Callable[[List[Dict]], bytes]) -> bytes:
+        """Encoded body for the view under key, rendered on first use"""
+        body = self._responses.get(key)
+        if body is None:
+            body = render(rows())
+            self._responses[key] = body
+        return body
+
+    def patched(self, product_id: int, row: Optional[Dict]) -> '_Snapshot':
+        """Snapshot with one product replaced (or with row=None removed).
+
+        Sorted lists and response bodies of categories the change does not
+        touch are reused as they are.
+        """
+        old = self.by_id.get(product_id)
+        rows = dict(self.by_id)
+        if row is None:
+            rows.pop(product_id, None)
+        else:
+            rows[product_id] = row
+        snapshot = _Snapshot(list(rows.values()))
+        changed = {_fold(r.get('category')) for r in (old, row) if r is not None}
+        snapshot._by_name = {
+            category: view for category, view in list(self._by_name.items()) if category not in changed
+        }
+        snapshot._responses = {
+            key: body for key, body in list(self._responses.items())
+            if key[1] is not None and key[1] not in changed
+        }
+        return snapshot
+
+class ProductCatalog:
+    BUS_NAME = 'catalog'
+
+    def __init__(self, db: Database, bus: Optional[InvalidationBus] = None,
+                 render: Optional[Callable[[List[Dict]], bytes]] = None, max_age: float = 0):
+        self.db = db
+        self.bus = bus
+        self.render = render  # Encodes a listing response body from its rows
+        self.max_age = max_age  # Seconds before the table is reloaded, 0 disables
+        self._lock = threading.Lock()
+        self._snapshot: Optional[_Snapshot] = None
+        self._loaded_at = 0.0  # When the table behind the snapshot was last read in full
+        self._generation = 0  # Bumped on every change so stale loads are discarded
+        if bus is not None:
+            bus.subscribe(self.BUS_NAME, self._drop)
+
+    def _drop(self):
+        """Forget the snapshot without publishing (another process changed the data)"""
+        with self._lock:
+            self._generation += 1
+            self._snapshot = None
+
+    def _publish(self):
+        if self.bus is not None:
+            self.bus.publish(self.BUS_NAME)
+
+    def _expired(self) -> bool:
+        """Whether the snapshot is past max_age; only the first caller to notice gets True"""
+        if not self.max_age:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if now - self._loaded_at < self.max_age:
+                return False
+            self._loaded_at = now  # Everyone else keeps the current snapshot while this caller reloads
+            return True
+
+    def _current(self) -> Optional[_Snapshot]:
+        """Return the cached snapshot, loading the table if needed"""
+        if self.bus is not None:
+            self.bus.poll()
+        current = self._snapshot
+        if current is not None and not self._expired():
+            return current
+        generation = self._generation
+        started = time.monotonic()
+        rows = self.db.execute_query("SELECT * FROM products")
+        if rows is None:
+            return current  # Database error: keep serving what we have, never cache an empty menu
+        if current is not None and {row['id']: row for row in rows} == current.by_id:
+            return current  # Unchanged: keep the snapshot and the responses it already encoded
+        snapshot = _Snapshot(rows)
+        with self._lock:
+            if generation == self._generation:
+                self._snapshot = snapshot
+                self._loaded_at = started
+        return snapshot
+
+    def _patch(self, product_id: int, row: Optional[Dict]):
+        """Replace (or with row=None remove) one product in the cached snapshot"""
+        with self._lock:
+            self._generation += 1
+            if self._snapshot is None:
+                return
+            self._snapshot = self._snapshot.patched(product_id, row)
+
+    # Reads (always return copies so callers cannot corrupt the cache)
+    def get_all_products(self, sort_by: str = 'all', search: str = '') -> Optional[List[Dict]]:
+        """Products for a sort_by mode, optionally filtered by a name substring"""
+        snapshot = self._current()
+        if snapshot is None:
+            return None
+        rows = snapshot.sorted_view(sort_by)
+        if search:
+            matches = snapshot.name_index.search(search)
+            rows = [row for row in rows if row['id'] in matches]
+        return [dict(row) for row in rows]
+
+    def search_products(self, sort_by: str, search: str) -> Optional[List[Dict]]:
+        """Products in a sort_by view matching search, ranked by relevance"""
+        snapshot = self._current()
+        if snapshot is None:
+            return None
+        rows = snapshot.search_engine.search(search, snapshot.sorted_view(sort_by))
+        return [dict(row) for row in rows]
+    
+    def get_products_by_category(self, category: str) -> Optional[List[Dict]]:
+        """Products in a category ordered by name"""
+        snapshot = self._current()
+        if snapshot is None:
+            return None
+        return [dict(row) for row in snapshot.by_name(category)]
+
+    def listing_response(self, sort_by: str = 'all') -> Optional[bytes]:
+        """Encoded response body for the unfiltered sort_by listing, or None without a render function"""
+        if self.render is None:
+            return None
+        snapshot = self._current()
+        if snapshot is None:
+            return None
+        return snapshot.response(_listing_key(sort_by), lambda: snapshot.sorted_view(sort_by), self.render)
+
+    def category_response(self, category: str) -> Optional[bytes]:
+        """Encoded response body for the products of a category, or None without a render function"""
+        if self.render is None:
+            return None
+        snapshot = self._current()
+        if snapshot is None:
+            return None
+        folded = _fold(category)
+        if folded not in snapshot.by_category:
+            # Unknown categories are not cached, so clients cannot grow the cache
+            return self.render([])
+        return snapshot.response(('category', folded), lambda: snapshot.by_name(category), self.render)
+
+    def get_product(self, product_id: int) -> Optional[Dict]:
+        """Product by ID, or None"""
+        snapshot = self._current()
+        if snapshot is None:
+            return None
+        row = snapshot.by_id.get(product_id)
+        return dict(row) if row else None
+
+    def get_categories(self) -> Optional[List[str]]:
+        """Distinct in-stock categories in alphabetical order"""
+        snapshot = self._current()
+        if snapshot is None:
+            return None
+        return sorted(snapshot.categories, key=_fold)
+
+    def count(self) -> Optional[int]:
+        """Number of products"""
+        snapshot = self._current()
+        return len(snapshot.by_id) if snapshot is not None else None
+
+    # Writes
+    def invalidate(self):
+        """Drop the cache; the next read reloads the table"""
+        self._drop()
+        self._publish()
+
+    def refresh_product(self, product_id: Optional[int]):
+        """Reload one product from the database after it was added or updated"""
+        if not product_id:
+            self.invalidate()
+            return
+        result = self.db.execute_query("SELECT * FROM products WHERE id = %s", (product_id,))
+        if result is None:
+            self.invalidate()
+        else:
+            self._patch(product_id, result[0] if result else None)
+            self._publish()
+
+    def update_product_fields(self, product_id: int, fields: Dict):
+        """Patch columns of a cached product whose new values are already known"""
+        with self._lock:
+            self._generation += 1
+            row = self._snapshot.by_id.get(product_id) if self._snapshot else None
+            if row is None:
+                self._snapshot = None
+            else:
+                self._snapshot = self._snapshot.patched(product_id, {**row, **fields})
+        self._publish()
+
+    def remove_product(self, product_id: int):
+        """Drop a deleted product from the cache"""
+        self._patch(product_id, None)
+        self._publish()
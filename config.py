@@ -18,6 +18,70 @@ DB_CONFIG = {
 }
 # Note: Set these as environment variables in Render dashboard
 
+# Connection Pool Configuration
+# Every request checks a connection out of the pool instead of sharing one socket
+DB_POOL_CONFIG = {
+    'min_size': int(os.getenv('DB_POOL_MIN', '1')),  # Connections kept open even when idle
+    'max_size': int(os.getenv('DB_POOL_MAX', '10')),  # Hard cap on open connections
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),  # Seconds to wait for a free connection
+    'idle_timeout': float(os.getenv('DB_POOL_IDLE_TIMEOUT', '300')),  # Close idle connections after this many seconds
+    'ping_after': float(os.getenv('DB_POOL_PING_AFTER', '5'))  # Ping connections idle longer than this on checkout
+}
+
+# Server Configuration
+# SERVER_MODE: 'single' (one request at a time), 'threaded' (bounded worker thread pool)
+# 'prefork' (several threaded worker processes sharing the listen socket)
+# or 'asyncio' (coroutine per connection, handlers run on the worker thread pool)
+SERVER_CONFIG = {
+    'mode': os.getenv('SERVER_MODE', 'threaded'),
+    'workers': int(os.getenv('SERVER_WORKERS', '16')),  # Requests handled concurrently (per process)
+    'backlog': int(os.getenv('SERVER_BACKLOG', '128')),  # Pending connections queued by the kernel
+    'processes': int(os.getenv('SERVER_PROCESSES', '0')),  # Pre-forked workers, 0 = one per CPU core
+    'reuse_port': os.getenv('SERVER_REUSE_PORT', 'False').lower() == 'true',  # Each worker binds with SO_REUSEPORT
+    'keepalive_timeout': float(os.getenv('SERVER_KEEPALIVE_TIMEOUT', '15')),  # Idle seconds before a persistent connection closes
+    'keepalive_max_requests': int(os.getenv('SERVER_KEEPALIVE_MAX_REQUESTS', '100'))  # Requests served per connection
+}
+
+# Cache Configuration
+# Workers poll the cache_versions table at most this often to pick up changes made by other processes
+CACHE_CONFIG = {
+    'poll_interval': float(os.getenv('CACHE_POLL_INTERVAL', '1')),
+    'stats_reconcile_interval': float(os.getenv('STATS_RECONCILE_INTERVAL', '300')),  # Reseed dashboard counters, 0 disables
+    'stats_max_age': float(os.getenv('STATS_MAX_AGE', '15')),  # Reseed dashboard counters on read after this many seconds (picks up PHP orders), 0 disables
+    'catalog_max_age': float(os.getenv('CATALOG_MAX_AGE', '60'))  # Reload the product cache after this many seconds (picks up PHP edits), 0 disables
+}
+
+# Idempotency Configuration
+# Responses to POST /api/orders and POST /api/cart are remembered per Idempotency-Key header
+IDEMPOTENCY_CONFIG = {
+    'ttl': float(os.getenv('IDEMPOTENCY_TTL', '86400')),  # Seconds a key is remembered
+    'max_entries': int(os.getenv('IDEMPOTENCY_MAX_ENTRIES', '10000')),  # In-memory LRU size
+    'persist': os.getenv('IDEMPOTENCY_PERSIST', 'False').lower() == 'true'  # Share keys across workers via MySQL
+}
+
+# Order ID Configuration
+# ORDER_ID_STRATEGY: 'time' (time-ordered, unique per worker id) or 'random' (legacy)
+# Every process writing orders needs its own worker id (0-63), so ORDER_ID_WORKER has no default:
+# the server refuses to start without it, except in pre-fork mode, where workers use base + slot
+# (base 0 when unset). Give each host its own range; a collision that still happens is caught by
+# create_order's oid check and retried with a new code.
+ORDER_ID_CONFIG = {
+    'strategy': os.getenv('ORDER_ID_STRATEGY', 'time'),
+    'worker_id': int(os.getenv('ORDER_ID_WORKER')) if os.getenv('ORDER_ID_WORKER') else None
+}
+
+# Cart Configuration
+# CART_ENGINE: 'db' (every change goes to MySQL) or 'memory' (write-behind, single process only)
+CART_CONFIG = {
+    'engine': os.getenv('CART_ENGINE', 'db'),
+    'flush_interval': float(os.getenv('CART_FLUSH_INTERVAL', '2')),  # Seconds between batched writes
+    'journal_path': os.getenv('CART_JOURNAL', 'cart_journal.log'),  # Local append-only log replayed after a crash
+    'idle_timeout': float(os.getenv('CART_IDLE_TIMEOUT', '1800')),  # Forget untouched, fully flushed carts
+    'ttl': float(os.getenv('CART_TTL', '604800')),  # Delete cart rows untouched this long, 0 disables
+    'expiry_interval': float(os.getenv('CART_EXPIRY_INTERVAL', '3600')),  # Seconds between expiry runs
+    'expiry_batch': int(os.getenv('CART_EXPIRY_BATCH', '500'))  # Rows per DELETE
+}
+
 # API Configuration
 API_BASE_URL = os.getenv('API_BASE_URL', 'https://srv2049-files.hstgr.io/46316da882db1028/files/public_html/csc4/')
 
@@ -8,25 +8,194 @@ User: root
 Password: (empty)
 
 This ensures both the tkinter desktop app and the main web system share the same data.
+
+Connections are handed out by a thread-safe pool, so concurrent requests each
+get their own connection instead of interleaving cursors on a single socket.
 """
 import mysql.connector
 from mysql.connector import Error
 from typing import Optional, Dict, List, Tuple
+from contextlib import contextmanager
+from collections import deque
 import hashlib
+import threading
+import time
+
+class PoolTimeoutError(Error):
+    """Raised when no pooled connection becomes available in time"""
+    pass
+
+class ConnectionPool:
+    def __init__(self, connect_args: Dict, min_size: int = 1, max_size: int = 10,
+                 timeout: float = 10.0, idle_timeout: float = 300.0, ping_after: float = 5.0):
+        self.connect_args = connect_args
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.ping_after = ping_after
+        self._idle = deque()  # (connection, last_used) pairs, most recently used on the right
+        self._size = 0  # Idle plus checked-out connections
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def _new_connection(self):
+        """Open a new MySQL connection"""
+        return mysql.connector.connect(**self.connect_args)
+
+    @staticmethod
+    def _close_quietly(conn):
+        """Close a connection, ignoring errors from dead sockets"""
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _reap_idle(self) -> List:
+        """Detach connections idle past idle_timeout (caller holds the lock)"""
+        expired = []
+        now = time.monotonic()
+        # Oldest connections are on the left
+        while self._idle and self._size > self.min_size and now - self._idle[0][1] > self.idle_timeout:
+            conn, _ = self._idle.popleft()
+            self._size -= 1
+            expired.append(conn)
+        return expired
+
+    def fill(self):
+        """Open connections until min_size is reached"""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._new_connection()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            self.release(conn)
+
+    def acquire(self):
+        """Check out a healthy connection, waiting up to timeout seconds"""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn = None
+            last_used = None
+            create = False
+            with self._cond:
+                if self._closed:
+                    raise Error("Connection pool is closed")
+                expired = self._reap_idle()
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                elif self._size < self.max_size:
+                    self._size += 1
+                    create = True
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError(f"Timed out after {self.timeout}s waiting for a database connection")
+                    self._cond.wait(remaining)
+            for dead in expired:
+                self._close_quietly(dead)
+
+            if create:
+                try:
+                    return self._new_connection()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+
+            if conn is not None:
+                # Health ping on checkout, skipped for connections used moments ago
+                if time.monotonic() - last_used <= self.ping_after:
+                    return conn
+                try:
+                    if conn.is_connected():
+                        return conn
+                except Exception:
+                    pass
+                self._discard(conn)
+
+    def release(self, conn, discard: bool = False):
+        """Return a connection to the pool"""
+        if discard:
+            self._discard(conn)
+            return
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                close = True
+            else:
+                self._idle.append((conn, time.monotonic()))
+                close = False
+            self._cond.notify()
+        if close:
+            self._close_quietly(conn)
+
+    def _discard(self, conn):
+        """Drop a broken connection and free its slot"""
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+        self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and back in"""
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except Error:
+            broken = not self._is_alive(conn)
+            raise
+        finally:
+            self.release(conn, discard=broken)
+
+    @staticmethod
+    def _is_alive(conn) -> bool:
+        try:
+            return conn.is_connected()
+        except Exception:
+            return False
+
+    def close(self):
+        """Close all idle connections; checked-out ones close on release"""
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._size -= len(idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn in idle:
+            self._close_quietly(conn)
+
+    def stats(self) -> Dict:
+        """Current pool occupancy"""
+        with self._cond:
+            return {'size': self._size, 'idle': len(self._idle), 'max_size': self.max_size}
 
 class Database:
     def __init__(self):
         # Database configuration - supports both local and Hostinger deployment
         # Use environment variables for Hostinger, fallback to config or local defaults
         import os
+        pool_config = {}
         try:
             # Try to import config from backend folder
-            from .config import DB_CONFIG
+            from .config import DB_CONFIG, DB_POOL_CONFIG
             self.host = os.getenv('DB_HOST', DB_CONFIG.get('host', 'localhost'))
             self.port = int(os.getenv('DB_PORT', DB_CONFIG.get('port', 3306)))
             self.database = os.getenv('DB_NAME', DB_CONFIG.get('database', 'chickenbites'))
             self.user = os.getenv('DB_USER', DB_CONFIG.get('user', 'root'))
             self.password = os.getenv('DB_PASSWORD', DB_CONFIG.get('password', ''))
+            pool_config = DB_POOL_CONFIG
         except ImportError:
             # Fallback to environment variables or defaults
             self.host = os.getenv('DB_HOST', 'localhost')
@@ -34,20 +203,45 @@ class Database:
             self.database = os.getenv('DB_NAME', 'chickenbites')
             self.user = os.getenv('DB_USER', 'root')
             self.password = os.getenv('DB_PASSWORD', '')
-        self.connection: Optional[mysql.connector.MySQLConnection] = None
-    
+        self.pool_min_size = int(os.getenv('DB_POOL_MIN', pool_config.get('min_size', 1)))
+        self.pool_max_size = int(os.getenv('DB_POOL_MAX', pool_config.get('max_size', 10)))
+        self.pool_timeout = float(os.getenv('DB_POOL_TIMEOUT', pool_config.get('timeout', 10)))
+        self.pool_idle_timeout = float(os.getenv('DB_POOL_IDLE_TIMEOUT', pool_config.get('idle_timeout', 300)))
+        self.pool_ping_after = float(os.getenv('DB_POOL_PING_AFTER', pool_config.get('ping_after', 5)))
+        self.pool: Optional[ConnectionPool] = None
+        self._pool_lock = threading.Lock()
+        self._local = threading.local()  # Per-thread last insert ID and row count
+
+    def _get_pool(self) -> ConnectionPool:
+        """Create the connection pool on first use"""
+        if self.pool is None:
+            with self._pool_lock:
+                if self.pool is None:
+                    self.pool = ConnectionPool(
+                        {
+                            'host': self.host,
+                            'port': self.port,
+                            'database': self.database,
+                            'user': self.user,
+                            'password': self.password,
+                            'connection_timeout': 10,
+                            'autocommit': True
+                        },
+                        min_size=self.pool_min_size,
+                        max_size=self.pool_max_size,
+                        timeout=self.pool_timeout,
+                        idle_timeout=self.pool_idle_timeout,
+                        ping_after=self.pool_ping_after
+                    )
+        return self.pool
+
     def connect(self) -> bool:
-        """Establish database connection"""
+        """Open the connection pool and verify the database is reachable"""
         try:
-            self.connection = mysql.connector.connect(
-                host=self.host,
-                port=self.port,
-                database=self.database,
-                user=self.user,
-                password=self.password,
-                connection_timeout=10,
-                autocommit=True
-            )
+            pool = self._get_pool()
+            pool.fill()
+            with pool.connection():
+                pass
             return True
         except Error as e:
             error_msg = str(e)
@@ -59,59 +253,97 @@ class Database:
             print(f"Unexpected error connecting to database: {error_msg}")
             print(f"Connection details: host={self.host}, port={self.port}, database={self.database}, user={self.user}")
             return False
-    
+
     def disconnect(self):
-        """Close database connection"""
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
-    
+        """Close all pooled connections"""
+        with self._pool_lock:
+            pool, self.pool = self.pool, None
+        if pool:
+            pool.close()
+
+    def reset_after_fork(self):
+        """Forget the pool inherited from a parent process without closing its sockets"""
+        self.pool = None
+        self._pool_lock = threading.Lock()
+        self._local = threading.local()
+
+    def ping(self) -> bool:
+        """Check that a pooled connection can reach the database"""
+        try:
+            with self._get_pool().connection() as conn:
+                return conn.is_connected()
+        except Exception as e:
+            print(f"Error pinging database: {e}")
+            return False
+
     def execute_query(self, query: str, params: Tuple = None) -> Optional[List[Dict]]:
         """Execute SELECT query and return results"""
         try:
-            if not self.connection or not self.connection.is_connected():
-                self.connect()
-            
-            cursor = self.connection.cursor(dictionary=True)
-            cursor.execute(query, params or ())
-            results = cursor.fetchall()
-            cursor.close()
-            return results
+            with self._get_pool().connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                try:
+                    cursor.execute(query, params or ())
+                    return cursor.fetchall()
+                finally:
+                    cursor.close()
         except Error as e:
             print(f"Error executing query: {e}")
             return None
-    
+
     def execute_update(self, query: str, params: Tuple = None) -> bool:
         """Execute INSERT/UPDATE/DELETE query"""
         try:
-            if not self.connection or not self.connection.is_connected():
-                self.connect()
-            
-            cursor = self.connection.cursor()
-            cursor.execute(query, params or ())
-            self.connection.commit()
-            cursor.close()
-            return True
+            with self._get_pool().connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(query, params or ())
+                    conn.commit()
+                    self._local.last_insert_id = cursor.lastrowid
+                    self._local.last_rowcount = cursor.rowcount
+                    return True
+                except Error:
+                    try:
+                        conn.rollback()
+                    except Error:
+                        pass
+                    raise
+                finally:
+                    cursor.close()
         except Error as e:
             print(f"Error executing update: {e}")
-            if self.connection:
-                self.connection.rollback()
             return False
-    
+
+    @contextmanager
+    def transaction(self):
+        """Run several statements on one pooled connection as a single transaction.
+
+        Yields a dictionary cursor. Commits when the block finishes and rolls
+        back (re-raising the error) if it raises.
+        """
+        with self._get_pool().connection() as conn:
+            conn.start_transaction()
+            cursor = conn.cursor(dictionary=True)
+            try:
+                yield cursor
+                conn.commit()
+            except BaseException:
+                try:
+                    conn.rollback()
+                except Error:
+                    pass
+                raise
+            finally:
+                cursor.close()
+
     def get_last_insert_id(self) -> Optional[int]:
-        """Get last inserted ID"""
-        try:
-            cursor = self.connection.cursor()
-            cursor.execute("SELECT LAST_INSERT_ID()")
-            result = cursor.fetchone()
-            cursor.close()
-            return result[0] if result else None
-        except Error as e:
-            print(f"Error getting last insert ID: {e}")
-            return None
-    
+        """Get last inserted ID from this thread's most recent update"""
+        return getattr(self._local, 'last_insert_id', None) or None
+
+    def get_last_rowcount(self) -> int:
+        """Rows affected by this thread's most recent update"""
+        return getattr(self._local, 'last_rowcount', 0)
+
     @staticmethod
     def hash_password(password: str) -> str:
         """Hash password using SHA1 (matching PHP sha1)"""
         return hashlib.sha1(password.encode()).hexdigest()
-
-
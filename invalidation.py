@@ -0,0 +1,75 @@
+"""
+Cache invalidation bus - keeps per-process caches coherent across workers
+
+Every cache has a version row in cache_versions. A process that changes the
+underlying data bumps the row; every process polls the table at most once per
+poll interval and drops caches whose version moved. The row lives in MySQL, so
+this works for pre-forked workers and for separate hosts alike.
+"""
+from .database import Database
+from typing import Callable, Dict, List
+import threading
+import time
+
+class InvalidationBus:
+    def __init__(self, db: Database, poll_interval: float = 1.0):
+        self.db = db
+        self.poll_interval = poll_interval
+        self._known: Dict[str, int] = {}  # name -> last version this process has accounted for
+        self._listeners: Dict[str, List[Callable]] = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+
+    def subscribe(self, name: str, callback: Callable):
+        """Call callback whenever another process changes the named data"""
+        self._listeners.setdefault(name, []).append(callback)
+
+    def _notify(self, name: str):
+        for callback in self._listeners.get(name, []):
+            callback()
+
+    def publish(self, name: str):
+        """Record that this process changed the named data"""
+        # LAST_INSERT_ID(expr) hands the new version back without a second query
+        query = """
+            INSERT INTO cache_versions (name, version) VALUES (%s, LAST_INSERT_ID(1))
+            ON DUPLICATE KEY UPDATE version = LAST_INSERT_ID(version + 1)
+        """
+        if not self.db.execute_update(query, (name,)):
+            return
+        version = self.db.get_last_insert_id()
+        if version is None:
+            return
+        with self._lock:
+            known = self._known.get(name)
+            self._known[name] = max(version, known or 0)
+        # A gap means other processes published too; their changes still need applying
+        if known is not None and version > known + 1:
+            self._notify(name)
+
+    def poll(self, force: bool = False):
+        """Fetch versions if the poll interval has passed and notify changed caches"""
+        if not force and time.monotonic() - self._checked_at < self.poll_interval:
+            return
+        # One thread polls; the others keep serving from cache
+        if not self._poll_lock.acquire(blocking=False):
+            return
+        try:
+            result = self.db.execute_query("SELECT name, version FROM cache_versions")
+            self._checked_at = time.monotonic()
+            if result is None:
+                return
+            changed = []
+            with self._lock:
+                for row in result:
+                    name, version = row['name'], row['version']
+                    known = self._known.get(name)
+                    if known is None or version > known:
+                        self._known[name] = version
+                        if known is not None:
+                            changed.append(name)
+            for name in changed:
+                self._notify(name)
+        finally:
+            self._poll_lock.release()
@@ -0,0 +1,162 @@
+"""
+Schema migrations - tables and indexes the Python backend adds to the shared schema
+
+The PHP system owns the original tables, so every change here is additive.
+Each migration runs once; applied names are recorded in schema_migrations.
+"""
+from .database import Database
+from typing import Callable, List, Tuple, Union
+
+def _index_exists(db: Database, table: str, index: str) -> bool:
+    query = """
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        LIMIT 1
+    """
+    return bool(db.execute_query(query, (table, index)))
+
+def _column_exists(db: Database, table: str, column: str) -> bool:
+    query = """
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+        LIMIT 1
+    """
+    return bool(db.execute_query(query, (table, column)))
+
+def add_column(table: str, column: str, definition: str) -> Callable[[Database], bool]:
+    """Migration step that adds a column unless it already exists"""
+    def step(db: Database) -> bool:
+        if _column_exists(db, table, column):
+            return True
+        return db.execute_update(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return step
+
+def add_index(table: str, index: str, columns: str, unique: bool = False) -> Callable[[Database], bool]:
+    """Migration step that creates an index unless it already exists"""
+    def step(db: Database) -> bool:
+        if _index_exists(db, table, index):
+            return True
+        kind = 'UNIQUE INDEX' if unique else 'INDEX'
+        return db.execute_update(f"CREATE {kind} {index} ON {table} ({columns})")
+    return step
+
+def _merge_duplicate_cart_rows(db: Database) -> bool:
+    """Fold repeated (user_id, pid) cart rows into the oldest one, summing quantities"""
+    duplicates = """
+        SELECT user_id, pid, MIN(id) AS keep_id, SUM(quantity) AS quantity
+        FROM cart GROUP BY user_id, pid HAVING COUNT(*) > 1
+    """
+    try:
+        with db.transaction() as cursor:
+            cursor.execute(f"""
+                UPDATE cart c JOIN ({duplicates}) d ON c.id = d.keep_id
+                SET c.quantity = d.quantity
+            """)
+            cursor.execute(f"""
+                DELETE c FROM cart c JOIN ({duplicates}) d
+                ON c.user_id = d.user_id AND c.pid = d.pid AND c.id <> d.keep_id
+            """)
+        return True
+    except Exception as e:
+        print(f"Error merging cart rows: {e}")
+        return False
+
+def _add_cart_unique_index(db: Database, attempts: int = 3) -> bool:
+    """Merge duplicate cart rows and add the unique (user_id, pid) index.
+
+    The PHP site can insert a new duplicate between the merge and the index
+    build, so the pair is retried a few times.
+    """
+    step = add_index('cart', 'uniq_cart_user_product', 'user_id, pid', unique=True)
+    for _ in range(attempts):
+        if _merge_duplicate_cart_rows(db) and step(db):
+            return True
+    return False
+
+def _add_unique_oid_index(db: Database) -> bool:
+    """Unique index on orders.oid, unless old rows already share a code"""
+    if _index_exists(db, 'orders', 'uniq_orders_oid'):
+        return True
+    duplicates = db.execute_query("SELECT oid FROM orders GROUP BY oid HAVING COUNT(*) > 1 LIMIT 1")
+    if duplicates is None:
+        return False
+    if duplicates:
+        print("orders.oid already has duplicate codes, keeping it non-unique (create_order still checks)")
+        return True
+    return add_index('orders', 'uniq_orders_oid', 'oid', unique=True)(db)
+
+# (name, steps) in the order they must be applied; a step is SQL or a callable(db) -> bool
+MIGRATIONS: List[Tuple[str, List[Union[str, Callable[[Database], bool]]]]] = [
+    ('001_cache_versions', [
+        """
+        CREATE TABLE IF NOT EXISTS cache_versions (
+            name VARCHAR(64) NOT NULL PRIMARY KEY,
+            version BIGINT UNSIGNED NOT NULL DEFAULT 0
+        )
+        """,
+        "INSERT IGNORE INTO cache_versions (name, version) VALUES ('catalog', 0), ('stats', 0)"
+    ]),
+    ('002_idempotency_keys', [
+        """
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            idem_key VARCHAR(255) NOT NULL PRIMARY KEY,
+            fingerprint CHAR(64) NOT NULL,
+            status SMALLINT NULL,
+            response MEDIUMTEXT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            KEY idx_idempotency_created (created_at)
+        )
+        """
+    ]),
+    ('003_orders_oid_index', [
+        add_index('orders', 'idx_orders_oid', 'oid')
+    ]),
+    ('004_cart_unique_item', [
+        _add_cart_unique_index
+    ]),
+    ('005_cart_updated_at', [
+        add_column('cart', 'updated_at', 'TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP'),
+        add_index('cart', 'idx_cart_updated_at', 'updated_at')
+    ]),
+    ('006_order_items_product', [
+        add_column('order_items', 'product_id', 'INT NULL'),
+        add_column('order_items', 'price', 'DECIMAL(10, 2) NULL'),
+        # Best effort for old rows: items whose product was since renamed or deleted keep NULLs
+        """
+        UPDATE order_items JOIN products ON order_items.product_name = products.name
+        SET order_items.product_id = products.id, order_items.price = products.price
+        WHERE order_items.product_id IS NULL
+        """,
+        add_index('order_items', 'idx_order_items_order', 'order_id')
+    ]),
+    ('007_orders_oid_unique', [
+        _add_unique_oid_index
+    ]),
+]
+
+def run_migrations(db: Database) -> bool:
+    """Apply pending migrations, stopping at the first failure"""
+    create_query = """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            name VARCHAR(128) NOT NULL PRIMARY KEY,
+            applied_on TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    if not db.execute_update(create_query):
+        return False
+    result = db.execute_query("SELECT name FROM schema_migrations")
+    if result is None:
+        return False
+    applied = {row['name'] for row in result}
+    
+    for name, statements in MIGRATIONS:
+        if name in applied:
+            continue
+        for step in statements:
+            ok = step(db) if callable(step) else db.execute_update(step)
+            if not ok:
+                print(f"Migration {name} failed")
+                return False
+        db.execute_update("INSERT INTO schema_migrations (name) VALUES (%s)", (name,))
+        print(f"Applied migration {name}")
+    return True
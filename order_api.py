@@ -2,19 +2,62 @@
 Order API - handles order operations
 """
 from .database import Database
-from typing import List, Dict, Optional
-import random
-import string
+from .stats import DashboardStats
+from .order_ids import TimeOrderedIdGenerator
+from .cart_store import WriteBehindCartStore
+from .pagination import fetch_page
+from .projection import select_list, with_required
+from .search_index import OrderSearchIndex
+from mysql.connector.errors import IntegrityError
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 
+ORDER_ID_ATTEMPTS = 3  # Codes tried before a checkout gives up on an oid collision
+DUPLICATE_KEY = 1062  # MySQL error number for a unique index violation
+
+# Fields an order listing exposes; name is the customer's username, as the joined queries always returned
+ORDER_COLUMNS = {name: f"orders.{name}" for name in (
+    'id', 'user_id', 'oid', 'number', 'email', 'method', 'address',
+    'total_products', 'total_price', 'placed_on', 'payment_status'
+)}
+ORDER_COLUMNS['name'] = 'users.name'
+# Customer order history
+USER_ORDER_COLUMNS = {**ORDER_COLUMNS, 'full_name': "CONCAT(users.fname, ' ', users.mname, ' ', users.lname)"}
+# Admin and staff order lists
+MANAGED_ORDER_COLUMNS = {**ORDER_COLUMNS, 'fname': 'users.fname', 'mname': 'users.mname', 'lname': 'users.lname'}
+
+# Order items written by this API carry product_id and the price paid; rows from the PHP checkout
+# (and old rows the 006 backfill could not match) fall back to the product, found by id or by name
+ORDER_ITEM_SELECT = """order_items.product_name, order_items.quantity,
+            COALESCE(order_items.price, products.price) AS price,
+            COALESCE(order_items.product_id, products.id) AS product_id"""
+ORDER_ITEM_FROM = """FROM order_items
+            LEFT JOIN products ON products.id = order_items.product_id
+                OR (order_items.product_id IS NULL AND products.name = order_items.product_name)"""
+
 class OrderAPI:
-    def __init__(self, db: Database):
+    def __init__(self, db: Database, stats: Optional[DashboardStats] = None, id_generator=None,
+                 cart_store: Optional[WriteBehindCartStore] = None, search_index: Optional[OrderSearchIndex] = None):
         self.db = db
+        self.stats = stats
+        # Without a generator from the caller, codes are refused until a worker id is assigned
+        self.id_generator = id_generator or TimeOrderedIdGenerator(None)
+        self.cart_store = cart_store
+        self.search_index = search_index
     
-    def generate_order_id(self, length: int = 10) -> str:
-        """Generate random order ID"""
-        chars = string.ascii_letters + string.digits
-        return ''.join(random.choice(chars) for _ in range(length))
+    def generate_order_id(self) -> str:
+        """Generate order ID (10 characters, time-ordered by default)"""
+        return self.id_generator.next_id()
+    
+    def _unused_order_id(self, cursor) -> str:
+        """A new order code that no order has yet (two processes sharing a worker id would collide)"""
+        for _ in range(ORDER_ID_ATTEMPTS):
+            oid = self.generate_order_id()
+            cursor.execute("SELECT 1 FROM orders WHERE oid = %s LIMIT 1", (oid,))
+            if not cursor.fetchall():
+                return oid
+            print(f"Order ID {oid} is already taken, check ORDER_ID_WORKER is unique per process")
+        raise RuntimeError("Could not generate an unused order ID")
     
     def create_order(self, user_id: int, user_data: Dict, cart_items: List[Dict], payment_method: str) -> tuple[bool, str, Optional[str]]:
         """Create a new order from cart items"""
@@ -23,18 +66,15 @@ class OrderAPI:
             total_products = sum(item['quantity'] for item in cart_items)
             total_price = sum(item['price'] * item['quantity'] for item in cart_items)
             
-            # Generate order ID
-            oid = self.generate_order_id()
-            
             # Insert order (matching PHP system's checkout.php structure)
             order_query = """
                 INSERT INTO orders 
                 (user_id, oid, name, number, email, method, address, total_products, total_price, placed_on, payment_status) 
                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP, 'pending')
             """
-            order_params = (
+            order_params = [
                 user_id,
-                oid,
+                None,  # oid, picked inside the transaction
                 user_data['name'],
                 user_data['number'],
                 user_data['email'],
@@ -42,39 +82,68 @@ class OrderAPI:
                 user_data['address'],
                 total_products,
                 total_price
-            )
-            
-            if not self.db.execute_update(order_query, order_params):
-                return False, "Failed to create order!", None
-            
-            # Get order ID
-            order_id = self.db.get_last_insert_id()
-            if not order_id:
-                return False, "Failed to get order ID!", None
-            
-            # Insert order items
-            for item in cart_items:
-                item_query = """
-                    INSERT INTO order_items (order_id, product_name, quantity) 
-                    VALUES (%s, %s, %s)
-                """
-                if not self.db.execute_update(item_query, (order_id, item['name'], item['quantity'])):
-                    return False, "Failed to add order items!", None
-            
-            # Clear cart
+            ]
+            item_query = """
+                INSERT INTO order_items (order_id, product_id, product_name, quantity, price) 
+                VALUES (%s, %s, %s, %s, %s)
+            """
             clear_query = "DELETE FROM cart WHERE user_id = %s"
-            if not self.db.execute_update(clear_query, (user_id,)):
-                return False, "Order created but failed to clear cart!", oid
             
-            return True, "Order placed successfully!", oid
+            # Order, items and cart clear commit together or not at all
+            for attempt in range(ORDER_ID_ATTEMPTS):
+                try:
+                    with self.db.transaction() as cursor:
+                        oid = order_params[1] = self._unused_order_id(cursor)
+                        cursor.execute(order_query, tuple(order_params))
+                        order_id = cursor.lastrowid
+                        if not order_id:
+                            raise RuntimeError("Failed to get order ID!")
+                        
+                        # One multi-row INSERT for all items
+                        if cart_items:
+                            cursor.executemany(item_query, [
+                                (order_id, item.get('pid'), item['name'], item['quantity'], item['price'])
+                                for item in cart_items
+                            ])
+                        
+                        cursor.execute(clear_query, (user_id,))
+                    break
+                except IntegrityError as e:
+                    # Another process committed the same code first (caught by the unique oid index)
+                    if e.errno != DUPLICATE_KEY or attempt == ORDER_ID_ATTEMPTS - 1:
+                        raise
             
         except Exception as e:
             return False, f"Error creating order: {str(e)}", None
+        
+        # The order is committed from here on, so a failing cache update must not report a failed checkout
+        self._order_committed(order_id, user_id, user_data, oid, total_price)
+        return True, "Order placed successfully!", oid
+    
+    def _order_committed(self, order_id: int, user_id: int, user_data: Dict, oid: str, total_price):
+        """Best-effort in-process updates after an order committed; failures are logged"""
+        if self.search_index is not None:
+            try:
+                self.search_index.order_added(order_id, user_data['name'], user_data['email'], oid)
+            except Exception as e:
+                print(f"Error indexing order {order_id}: {e}")
+        
+        if self.cart_store is not None:
+            try:
+                # The transaction emptied the cart table; drop the in-memory cart and its pending writes
+                self.cart_store.clear(user_id)
+            except Exception as e:
+                print(f"Error clearing cached cart of user {user_id}: {e}")
+        
+        if self.stats is not None:
+            try:
+                self.stats.order_created(total_price)
+            except Exception as e:
+                print(f"Error updating order stats: {e}")  # The periodic reconcile corrects the counters
     
-    def get_orders(self, user_id: int, status_filter: str = 'all', sort_order: str = 'ASC') -> List[Dict]:
-        """Get orders for user"""
-        query = """
-            SELECT orders.*, users.name, CONCAT(users.fname, ' ', users.mname, ' ', users.lname) AS full_name 
+    def _orders_query(self, user_id: int, status_filter: str, fields: List[str]) -> Tuple[str, List]:
+        query = f"""
+            SELECT {select_list(USER_ORDER_COLUMNS, fields)} 
             FROM orders
             JOIN users ON orders.user_id = users.id
             WHERE orders.user_id = %s
@@ -87,27 +156,64 @@ class OrderAPI:
             else:
                 query += " AND payment_status = %s"
                 params.append(status_filter)
+        return query, params
+    
+    def get_orders(self, user_id: int, status_filter: str = 'all', sort_order: str = 'ASC',
+                   fields: Optional[List[str]] = None) -> List[Dict]:
+        """Get orders for user (fields: USER_ORDER_COLUMNS to select, default all; id is always included)"""
+        query, params = self._orders_query(user_id, status_filter, with_required(fields or USER_ORDER_COLUMNS, ['id']))
         
-        # Add ordering
+        # Add ordering (id breaks ties between orders placed in the same second)
         if sort_order == 'DESC':
-            query += " ORDER BY placed_on DESC"
+            query += " ORDER BY placed_on DESC, orders.id DESC"
         else:
-            query += " ORDER BY placed_on ASC"
+            query += " ORDER BY placed_on ASC, orders.id ASC"
         
         result = self.db.execute_query(query, tuple(params))
         return result if result else []
     
+    def get_orders_page(self, user_id: int, status_filter: str, sort_order: str, limit: int,
+                        after: Optional[str] = None, fields: Optional[List[str]] = None) -> Tuple[List[Dict], Optional[str]]:
+        """One page of get_orders, plus the cursor for the next page"""
+        direction = 'DESC' if sort_order == 'DESC' else 'ASC'
+        columns = [('orders.placed_on', direction, 'placed_on'), ('orders.id', direction, 'id')]
+        fields = with_required(fields or USER_ORDER_COLUMNS, [key for _, _, key in columns])
+        query, params = self._orders_query(user_id, status_filter, fields)
+        return fetch_page(self.db, query, params, columns, limit, after)
+    
     def get_order_items(self, order_id: int) -> List[Dict]:
-        """Get items for an order"""
-        query = """
-            SELECT order_items.product_name, order_items.quantity, products.price 
-            FROM order_items 
-            JOIN products ON order_items.product_name = products.name 
+        """Get items for an order, priced as they were at checkout"""
+        query = f"""
+            SELECT {ORDER_ITEM_SELECT}
+            {ORDER_ITEM_FROM}
             WHERE order_items.order_id = %s
         """
         result = self.db.execute_query(query, (order_id,))
         return result if result else []
     
+    def get_items_for_orders(self, order_ids: List[int]) -> Dict[int, List[Dict]]:
+        """Get items for many orders in one query, keyed by order ID"""
+        items = {order_id: [] for order_id in order_ids}
+        if not items:
+            return items
+        placeholders = ', '.join(['%s'] * len(items))
+        query = f"""
+            SELECT order_items.order_id, {ORDER_ITEM_SELECT}
+            {ORDER_ITEM_FROM}
+            WHERE order_items.order_id IN ({placeholders})
+        """
+        result = self.db.execute_query(query, tuple(items))
+        for row in result or []:
+            items[row.pop('order_id')].append(row)
+        return items
+    
+    def attach_items(self, orders: List[Dict]) -> List[Dict]:
+        """Nest each order's items under 'items' (one query for the whole list)"""
+        items = self.get_items_for_orders([order['id'] for order in orders])
+        for order in orders:
+            order['items'] = items[order['id']]
+        return orders
+    
     def update_order_status(self, order_id: str, user_id: int, action: str) -> tuple[bool, str]:
         """Update order status (cancel, confirm, etc.)"""
         if action == 'cancel':
@@ -125,7 +231,24 @@ class OrderAPI:
         else:
             return False, "Invalid action!"
         
+        # Previous status, so the dashboard counters can move the order between buckets
+        current = None
+        if self.stats is not None:
+            current = self.db.execute_query(
+                "SELECT payment_status, total_price FROM orders WHERE oid = %s AND user_id = %s",
+                (order_id, user_id)
+            )
+        
         if self.db.execute_update(query, (order_id, user_id)):
+            if current:
+                old_status = current[0]['payment_status']
+                if action == 'cancel':
+                    new_status = 'cancelled'
+                elif action == 'confirm':
+                    new_status = 'completed_confirmed' if old_status == 'delivered' else 'confirmed'
+                else:
+                    new_status = 'delivered'
+                self.stats.order_status_changed(old_status, new_status, current[0]['total_price'])
             return True, "Order status updated!"
         return False, "Failed to update order status!"
 
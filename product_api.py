@@ -2,14 +2,25 @@
 Product API - handles product operations
 """
 from .database import Database
+from .catalog import ProductCatalog
 from typing import Optional, List, Dict
 
+# Fields a product listing can be projected to with fields=
+PRODUCT_COLUMNS = {name: name for name in ('id', 'name', 'price', 'category', 'image', 'stock_status')}
+
 class ProductAPI:
-    def __init__(self, db: Database):
+    def __init__(self, db: Database, catalog: Optional[ProductCatalog] = None):
         self.db = db
+        self.catalog = catalog
     
     def get_all_products(self, sort_by: str = 'all', search: str = '') -> List[Dict]:
         """Get all products with optional sorting and search"""
+        if self.catalog is not None:
+            if search:
+                # Customers get typo-tolerant, ranked results
+                return self.catalog.search_products(sort_by, search) or []
+            return self.catalog.get_all_products(sort_by) or []
+        
         query = "SELECT * FROM products"
         params = []
         
@@ -55,18 +66,41 @@ class ProductAPI:
         if category.lower() == 'all':
             return self.get_all_products()
         
+        if self.catalog is not None:
+            return self.catalog.get_products_by_category(category) or []
+        
         query = "SELECT * FROM products WHERE category = %s ORDER BY name"
         result = self.db.execute_query(query, (category,))
         return result if result else []
     
+    def get_all_products_response(self, sort_by: str = 'all') -> Optional[bytes]:
+        """Pre-encoded response body for an unfiltered listing, or None when it has to be built"""
+        if self.catalog is None:
+            return None
+        return self.catalog.listing_response(sort_by)
+    
+    def get_products_by_category_response(self, category: str) -> Optional[bytes]:
+        """Pre-encoded response body for a category listing, or None when it has to be built"""
+        if self.catalog is None:
+            return None
+        if category.lower() == 'all':
+            return self.catalog.listing_response()
+        return self.catalog.category_response(category)
+    
     def get_product(self, product_id: int) -> Optional[Dict]:
         """Get product by ID"""
+        if self.catalog is not None:
+            return self.catalog.get_product(product_id)
+        
         query = "SELECT * FROM products WHERE id = %s"
         result = self.db.execute_query(query, (product_id,))
         return result[0] if result and len(result) > 0 else None
     
     def get_categories(self) -> List[str]:
         """Get all unique categories"""
+        if self.catalog is not None:
+            return self.catalog.get_categories() or []
+        
         query = "SELECT DISTINCT category FROM products WHERE category IS NOT NULL AND category != '' AND category != 'Out of stock' ORDER BY category"
         result = self.db.execute_query(query)
         if result:
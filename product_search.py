@@ -0,0 +1,117 @@
+"""
+Product search engine - typo-tolerant, ranked search over the cached menu
+
+Names and queries are split into words. Every query word has to match a word
+of the product name, scored exact > prefix > inside the word > fuzzy (a
+bounded edit distance from the word or from its start), and products whose
+whole name equals the query or that are best sellers rank higher. Anything
+the old substring search found is still found. Ties keep the order of the
+sort_by view the results were drawn from.
+"""
+from typing import Dict, List, Set
+import re
+
+EXACT = 4.0
+PREFIX = 3.0
+INFIX = 2.0
+FUZZY = 1.0
+WHOLE_NAME_BONUS = 4.0
+BEST_SELLER_BOOST = 0.5
+BOOSTED_CATEGORY = 'best seller'
+MAX_CACHED_TERMS = 1024  # Search-as-you-type repeats the same words
+
+_WORD = re.compile(r'\w+')
+
+def _words(text) -> List[str]:
+    return _WORD.findall((text or '').casefold())
+
+def max_edits(length: int) -> int:
+    """Typos tolerated in a query word of this length"""
+    if length <= 3:
+        return 0
+    return 1 if length <= 7 else 2
+
+def bounded_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance between a and b, or limit + 1 once it must exceed limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+class ProductSearchEngine:
+    def __init__(self, products: List[Dict]):
+        self._words = {product['id']: _words(product.get('name')) for product in products}
+        self._names = {product['id']: (product.get('name') or '').casefold().strip() for product in products}
+        self._boosted = {
+            product['id'] for product in products
+            if (product.get('category') or '').casefold().strip() == BOOSTED_CATEGORY
+        }
+        self._word_ids: Dict[str, Set[int]] = {}  # word -> ids of products whose name contains it
+        for product_id, words in self._words.items():
+            for word in words:
+                self._word_ids.setdefault(word, set()).add(product_id)
+        self._cache: Dict[str, Dict[int, float]] = {}
+
+    def _term_scores(self, term: str) -> Dict[int, float]:
+        """Best score of the query word term in each product name it matches"""
+        scores = self._cache.get(term)
+        if scores is None:
+            scores = {}
+            for word, score in self._word_scores(term).items():
+                for product_id in self._word_ids[word]:
+                    if score > scores.get(product_id, 0.0):
+                        scores[product_id] = score
+            if len(self._cache) >= MAX_CACHED_TERMS:
+                self._cache.clear()
+            self._cache[term] = scores
+        return scores
+
+    def _word_scores(self, term: str) -> Dict[str, float]:
+        """Score of every name word that matches the query word term"""
+        edits = max_edits(len(term))
+        scores = {}
+        for word in self._word_ids:
+            if word == term:
+                scores[word] = EXACT
+            elif word.startswith(term):
+                scores[word] = PREFIX
+            elif term in word:
+                scores[word] = INFIX
+            elif edits and (bounded_distance(term, word, edits) <= edits
+                            or (len(word) > len(term) and bounded_distance(term, word[:len(term)], edits) <= edits)):
+                scores[word] = FUZZY
+        return scores
+
+    def search(self, query: str, rows: List[Dict]) -> List[Dict]:
+        """rows matching query, best match first"""
+        needle = query.casefold().strip()
+        terms = _words(query)
+        per_term = sorted((self._term_scores(term) for term in terms), key=len)
+        totals: Dict[int, float] = {}
+        if per_term:
+            # Every query word has to match
+            for product_id in set(per_term[0]).intersection(*per_term[1:]):
+                totals[product_id] = sum(scores[product_id] for scores in per_term)
+        if needle:
+            for product_id, name in self._names.items():
+                if product_id not in totals and needle in name:
+                    totals[product_id] = INFIX * max(len(terms), 1)  # Substring across words or punctuation
+        ranked = []
+        for position, row in enumerate(rows):
+            total = totals.get(row['id'])
+            if total is None:
+                continue
+            if needle == self._names[row['id']]:
+                total += WHOLE_NAME_BONUS
+            if row['id'] in self._boosted:
+                total += BEST_SELLER_BOOST
+            ranked.append((-total, position, row))
+        ranked.sort(key=lambda entry: entry[:2])
+        return [row for _, _, row in ranked]
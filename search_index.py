@@ -0,0 +1,122 @@
+"""
+In-process search indexes - resolve substring searches to id sets without MySQL
+
+A trigram index maps every three-character slice of the indexed text to the
+ids containing it, so a search term is narrowed to candidates by intersecting
+a few sets and then confirmed with a plain substring test. Matching is
+case-insensitive, like the LIKE '%term%' queries it replaces. Terms shorter
+than three characters fall back to scanning the indexed text in memory.
+"""
+from .database import Database
+from typing import Dict, Optional, Set
+import threading
+import time
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class TrigramIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._texts: Dict[int, str] = {}
+        self._postings: Dict[str, Set[int]] = {}
+
+    def __len__(self):
+        return len(self._texts)
+
+    def add(self, doc_id: int, *fields):
+        """Index (or re-index) doc_id under the given text fields"""
+        # A separator no search term contains keeps matches from spanning two fields
+        text = '\x00'.join(str(field).casefold() for field in fields if field is not None)
+        with self._lock:
+            self._remove(doc_id)
+            self._texts[doc_id] = text
+            for gram in _trigrams(text):
+                self._postings.setdefault(gram, set()).add(doc_id)
+
+    def _remove(self, doc_id: int):
+        text = self._texts.pop(doc_id, None)
+        if text is None:
+            return
+        for gram in _trigrams(text):
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del self._postings[gram]
+
+    def remove(self, doc_id: int):
+        with self._lock:
+            self._remove(doc_id)
+
+    def search(self, term: str) -> Set[int]:
+        """Ids whose indexed text contains term (case-insensitive)"""
+        needle = term.casefold()
+        with self._lock:
+            if len(needle) < 3:
+                candidates = self._texts.keys()
+            else:
+                postings = sorted((self._postings.get(gram, set()) for gram in _trigrams(needle)), key=len)
+                candidates = set(postings[0]).intersection(*postings[1:])
+            return {doc_id for doc_id in candidates if needle in self._texts[doc_id]}
+
+class OrderSearchIndex:
+    """Trigram index over orders.id, name, email and oid for the admin order search.
+
+    Loaded with one query on the first search. Orders created in this process
+    are added directly; orders created elsewhere are picked up by an id range
+    query at most every refresh_interval seconds (order ids only grow). Those
+    fields never change after checkout, and an id deleted elsewhere that is
+    still indexed only matches nothing in the final SQL query.
+    """
+    def __init__(self, db: Database, refresh_interval: float = 1.0):
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._index: Optional[TrigramIndex] = None
+        self._max_id = 0
+        self._refreshed = 0.0
+
+    def _load(self, rows, index: TrigramIndex):
+        for row in rows:
+            index.add(row['id'], row['id'], row.get('name'), row.get('email'), row.get('oid'))
+            self._max_id = max(self._max_id, row['id'])
+
+    def _refresh(self) -> Optional[TrigramIndex]:
+        with self._lock:
+            now = time.monotonic()
+            if self._index is not None and now - self._refreshed < self.refresh_interval:
+                return self._index
+            if self._index is None:
+                rows = self.db.execute_query("SELECT id, name, email, oid FROM orders")
+                if rows is None:
+                    return None
+                self._max_id = 0
+                index = TrigramIndex()
+                self._load(rows, index)
+                self._index = index
+            else:
+                rows = self.db.execute_query(
+                    "SELECT id, name, email, oid FROM orders WHERE id > %s", (self._max_id,)
+                )
+                if rows is None:
+                    return None
+                self._load(rows, self._index)
+            self._refreshed = now
+            return self._index
+
+    def search(self, term: str) -> Optional[Set[int]]:
+        """Ids of orders matching term, or None if the index cannot be loaded"""
+        index = self._refresh()
+        return index.search(term) if index is not None else None
+
+    def order_added(self, order_id: int, name: str, email: str, oid: str):
+        with self._lock:
+            if self._index is not None:
+                # _max_id is left alone so orders other processes created before this one are still fetched
+                self._index.add(order_id, order_id, name, email, oid)
+
+    def order_removed(self, order_id: int):
+        with self._lock:
+            if self._index is not None:
+                self._index.remove(order_id)
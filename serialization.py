@@ -0,0 +1,14 @@
+"""
+JSON encoding shared by responses and everything that stores them
+
+MySQL returns DECIMAL columns as Decimal, which json cannot encode. Responses
+and stored copies of responses (idempotency replays) must encode them the same
+way, so both use json_default.
+"""
+from decimal import Decimal
+
+def json_default(value):
+    """Encode values json cannot: Decimal as an int when whole, otherwise a float"""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
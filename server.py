@@ -2,43 +2,540 @@
 Simple Python HTTP Server for Chicken Bites Backend
 Upload this to Hostinger - no Flask, no FastAPI, just pure Python
 """
+import collections
+import functools
 import http.server
 import socketserver
 import json
+import os
+import selectors
+import signal
+import socket
+import sys
+import threading
+import time
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from config import SERVER_CONFIG, CACHE_CONFIG, IDEMPOTENCY_CONFIG, ORDER_ID_CONFIG, CART_CONFIG
 from database import Database
-from user_api import UserAPI
-from product_api import ProductAPI
+from catalog import ProductCatalog, sort_key
+from invalidation import InvalidationBus
+from migrations import run_migrations
+from stats import DashboardStats
+from jobs import PeriodicJob
+from idempotency import IdempotencyStore
+from order_ids import create_generator
+from cart_store import WriteBehindCartStore
+from search_index import OrderSearchIndex
+from router import Router
+from serialization import json_default
+from pagination import parse_page_params, paginate_rows
+from projection import parse_fields, project
+from user_api import UserAPI, USER_COLUMNS
+from product_api import ProductAPI, PRODUCT_COLUMNS
 from cart_api import CartAPI
-from order_api import OrderAPI
+from order_api import OrderAPI, USER_ORDER_COLUMNS, MANAGED_ORDER_COLUMNS
 from admin_api import AdminAPI
 from staff_api import StaffAPI
 
+def _render_products(products):
+    """Body of a product listing response; the catalog keeps one per sort mode and category"""
+    return json.dumps({'success': True, 'products': products}, default=json_default).encode()
+
 # Initialize database and APIs
 db = Database()
-user_api = UserAPI(db)
-product_api = ProductAPI(db)
-cart_api = CartAPI(db)
-order_api = OrderAPI(db)
-admin_api = AdminAPI(db)
-staff_api = StaffAPI(db)
+bus = InvalidationBus(db, CACHE_CONFIG['poll_interval'])  # Cross-process cache versions
+catalog = ProductCatalog(db, bus, _render_products, CACHE_CONFIG['catalog_max_age'])  # Shared product cache, kept current by admin/staff writes
+dashboard_stats = DashboardStats(db, bus, CACHE_CONFIG['stats_max_age'])  # Dashboard counters, kept current by order/user/product writes
+order_search = OrderSearchIndex(db, CACHE_CONFIG['poll_interval'])  # Admin order search, resolved in memory
+user_api = UserAPI(db, dashboard_stats)
+product_api = ProductAPI(db, catalog)
+cart_store = None
+if CART_CONFIG['engine'] == 'memory':
+    cart_store = WriteBehindCartStore(db, CART_CONFIG['journal_path'], CART_CONFIG['idle_timeout'])
+cart_api = CartAPI(db, cart_store, catalog)
+order_ids = create_generator(ORDER_ID_CONFIG['strategy'], ORDER_ID_CONFIG['worker_id'])
+order_api = OrderAPI(db, dashboard_stats, order_ids, cart_store, order_search)
+admin_api = AdminAPI(db, catalog, dashboard_stats, order_search)
+staff_api = StaffAPI(db, catalog, dashboard_stats)
+idempotency_store = IdempotencyStore(
+    db,
+    max_entries=IDEMPOTENCY_CONFIG['max_entries'],
+    ttl=IDEMPOTENCY_CONFIG['ttl'],
+    persist=IDEMPOTENCY_CONFIG['persist']
+)
+
+# Periodic maintenance, started in each serving process
+jobs = [
+    PeriodicJob('stats-reconcile', CACHE_CONFIG['stats_reconcile_interval'], dashboard_stats.reconcile),
+    PeriodicJob('idempotency-purge', 3600 if idempotency_store.persist else 0, idempotency_store.purge_expired)
+]
+if cart_store is not None:
+    jobs.append(PeriodicJob('cart-flush', CART_CONFIG['flush_interval'], cart_store.flush))
+
+def expire_abandoned_carts():
+    removed = cart_api.expire_abandoned(CART_CONFIG['ttl'], CART_CONFIG['expiry_batch'])
+    if removed:
+        print(f"Expired {removed} abandoned cart rows")
+
+if CART_CONFIG['ttl'] > 0:
+    jobs.append(PeriodicJob('cart-expiry', CART_CONFIG['expiry_interval'], expire_abandoned_carts))
+
+def start_background_jobs():
+    """Seed in-process counters and start periodic jobs (call after any fork)"""
+    dashboard_stats.seed()
+    for job in jobs:
+        job.start()
+
+def stop_background_jobs():
+    """Stop periodic jobs and write out anything still buffered (call on shutdown)"""
+    for job in jobs:
+        job.stop()
+    if cart_store is not None:
+        cart_store.close()
+
+def disable_cart_store():
+    """Write carts straight to MySQL again (the in-memory store cannot be shared between processes)"""
+    global cart_store
+    if cart_store is None:
+        return
+    cart_store.close()
+    jobs[:] = [job for job in jobs if job.name != 'cart-flush']
+    cart_api.store = None
+    order_api.cart_store = None
+    cart_store = None
+
+router = Router()
+
+def idempotent(handler):
+    """Replay the stored response when a client retries with the same Idempotency-Key"""
+    @functools.wraps(handler)
+    def wrapper(req, **params):
+        key = req.headers.get('Idempotency-Key')
+        if not key:
+            return handler(req, **params)
+        if len(key) > 200:
+            req._send_json({'success': False, 'message': 'Idempotency-Key is too long'}, 400)
+            return
+        scoped_key = f"{req.command} {req.path.split('?')[0]} {key}"
+        fingerprint = IdempotencyStore.fingerprint(req.body)
+        state, record = idempotency_store.begin(scoped_key, fingerprint)
+        if state == IdempotencyStore.REPLAY:
+            req._send_json(record['body'], record['status'], {'Idempotent-Replayed': 'true'})
+            return
+        if state == IdempotencyStore.MISMATCH:
+            req._send_json({'success': False, 'message': 'Idempotency-Key was already used for a different request'}, 422)
+            return
+        if state == IdempotencyStore.BUSY:
+            req._send_json({'success': False, 'message': 'A request with this Idempotency-Key is still in progress'}, 409)
+            return
+        req.last_response = None
+        try:
+            handler(req, **params)
+        except BaseException:
+            if req.last_response is None:
+                idempotency_store.abort(scoped_key)
+            else:
+                # The write already happened; only sending the response failed (e.g. the client
+                # hung up), so the retry must get this response instead of repeating the write
+                idempotency_store.complete(scoped_key, fingerprint, *req.last_response)
+            raise
+        status, body = req.last_response
+        idempotency_store.complete(scoped_key, fingerprint, status, body)
+    return wrapper
+
+def _paged(req, columns, fetch_all, fetch_page):
+    """Rows for a listing: all of them, or one page when the request has limit/after.
+
+    columns are the fields the endpoint allows in fields=. fetch_all(fields)
+    returns the rows and fetch_page(limit, after, fields) returns (rows,
+    next_cursor); fields is None when the request does not project. Returns
+    (rows, extra response fields), or None after answering 400 for a bad
+    field, limit or cursor.
+    """
+    try:
+        fields = parse_fields(req.query, columns)
+        limit, after = parse_page_params(req.query)
+        if limit is None:
+            return fetch_all(fields), {}
+        rows, next_cursor = fetch_page(limit, after, fields)
+    except ValueError as e:
+        req._send_json({'success': False, 'message': str(e)}, 400)
+        return None
+    return rows, {'next_cursor': next_cursor}
+
+def _project_page(page, fields):
+    rows, next_cursor = page
+    return project(rows, fields), next_cursor
+
+def _paged_products(req, get_all_products, ranked=False):
+    """Product listing with optional keyset pagination over the sorted list.
+
+    ranked lists (relevance-ordered search results) page by result position.
+    """
+    sort_by = req.query.get('sort_by', 'all')
+    search = req.query.get('search', '')
+    products = get_all_products(sort_by, search)
+    if ranked and search:
+        positions = {product['id']: index for index, product in enumerate(products)}
+        key, tag = (lambda product: [positions[product['id']]]), f"products:{sort_by}:{search}"
+    else:
+        key, tag = sort_key(sort_by), f"products:{sort_by}"
+    page = _paged(
+        req,
+        PRODUCT_COLUMNS,
+        lambda fields: project(products, fields),
+        lambda limit, after, fields: _project_page(paginate_rows(products, key, tag, limit, after), fields)
+    )
+    if page is not None:
+        req._send_json({'success': True, 'products': page[0], **page[1]})
+
+# Health check
+@router.route('GET', '/api/health')
+def health(req):
+    if db.ping():
+        req._send_json({'success': True, 'status': 'healthy', 'database': 'connected'})
+    else:
+        req._send_json({'success': False, 'status': 'unhealthy', 'database': 'disconnected'}, 503)
+
+# User endpoints
+@router.route('GET', '/api/user/{user_id:int}')
+def get_user(req, user_id):
+    user = user_api.get_user(user_id)
+    if user:
+        req._send_json({'success': True, 'user': user})
+    else:
+        req._send_json({'success': False, 'message': 'User not found'}, 404)
+
+@router.route('POST', '/api/user/login')
+def login(req):
+    data = req.body
+    user = user_api.login(data.get('username'), data.get('password'))
+    if user:
+        req._send_json({'success': True, 'user': user})
+    else:
+        req._send_json({'success': False, 'message': 'Invalid credentials'}, 401)
+
+@router.route('POST', '/api/user/register')
+def register(req):
+    success, message = user_api.register(req.body)
+    req._send_json({'success': success, 'message': message})
+
+@router.route('PUT', '/api/user/{user_id:int}/profile')
+def update_profile(req, user_id):
+    success, message = user_api.update_profile(user_id, req.body)
+    req._send_json({'success': success, 'message': message})
+
+@router.route('PUT', '/api/user/{user_id:int}/address')
+def update_address(req, user_id):
+    success, message = user_api.update_address(user_id, req.body.get('address'))
+    req._send_json({'success': success, 'message': message})
+
+@router.route('PUT', '/api/user/{user_id:int}/username')
+def update_username(req, user_id):
+    success, message = user_api.update_username(user_id, req.body.get('username'))
+    req._send_json({'success': success, 'message': message})
+
+# Product endpoints
+@router.route('GET', '/api/products')
+def list_products(req):
+    if not ({'search', 'limit', 'after', 'fields'} & req.query.keys()):
+        # The most common request: the whole menu in one sort order, served pre-encoded
+        body = product_api.get_all_products_response(req.query.get('sort_by', 'all'))
+        if body is not None:
+            req._send_body(body)
+            return
+    _paged_products(req, product_api.get_all_products, ranked=product_api.catalog is not None)
+
+@router.route('GET', '/api/products/categories')
+def list_categories(req):
+    categories = product_api.get_categories()
+    req._send_json({'success': True, 'categories': categories})
+
+@router.route('GET', '/api/products/category/{category}')
+def list_products_by_category(req, category):
+    body = product_api.get_products_by_category_response(category)
+    if body is not None:
+        req._send_body(body)
+        return
+    products = product_api.get_products_by_category(category)
+    req._send_json({'success': True, 'products': products})
+
+@router.route('GET', '/api/products/{product_id:int}')
+def get_product(req, product_id):
+    product = product_api.get_product(product_id)
+    if product:
+        req._send_json({'success': True, 'product': product})
+    else:
+        req._send_json({'success': False, 'message': 'Product not found'}, 404)
+
+# Cart endpoints
+@router.route('GET', '/api/cart/{user_id:int}')
+def get_cart(req, user_id):
+    cart_items, total = cart_api.get_cart_with_total(user_id)
+    req._send_json({'success': True, 'cart': cart_items, 'total': total})
+
+@router.route('POST', '/api/cart')
+@idempotent
+def add_to_cart(req):
+    data = req.body
+    success, message = cart_api.add_to_cart(
+        data.get('user_id'),
+        data.get('product_id'),
+        data.get('quantity', 1),
+        data.get('product_data')
+    )
+    req._send_json({'success': success, 'message': message})
+
+@router.route('PUT', '/api/cart/{cart_id:int}')
+def update_cart_quantity(req, cart_id):
+    success, message = cart_api.update_quantity(cart_id, req.body.get('quantity'))
+    req._send_json({'success': success, 'message': message})
+
+@router.route('DELETE', '/api/cart/{cart_id:int}')
+def remove_cart_item(req, cart_id):
+    success, message = cart_api.remove_item(cart_id)
+    req._send_json({'success': success, 'message': message})
+
+@router.route('POST', '/api/cart/{user_id:int}/batch')
+@idempotent
+def batch_cart(req, user_id):
+    success, message, cart_items, total = cart_api.apply_batch(user_id, req.body.get('operations'))
+    if success:
+        req._send_json({'success': True, 'message': message, 'cart': cart_items, 'total': total})
+    else:
+        req._send_json({'success': False, 'message': message})
+
+@router.route('DELETE', '/api/cart/{user_id:int}/clear')
+def clear_cart(req, user_id):
+    success, message = cart_api.clear_cart(user_id)
+    req._send_json({'success': success, 'message': message})
+
+# Order endpoints
+def _includes(req) -> set:
+    """Values of the comma-separated include= query parameter"""
+    return {value.strip() for value in req.query.get('include', '').split(',') if value.strip()}
+
+@router.route('GET', '/api/orders/{user_id:int}')
+def list_orders(req, user_id):
+    status = req.query.get('status', 'all')
+    sort = req.query.get('sort', 'ASC')
+    page = _paged(
+        req,
+        USER_ORDER_COLUMNS,
+        lambda fields: order_api.get_orders(user_id, status, sort, fields),
+        lambda limit, after, fields: order_api.get_orders_page(user_id, status, sort, limit, after, fields)
+    )
+    if page is None:
+        return
+    orders, extra = page
+    if 'items' in _includes(req):
+        order_api.attach_items(orders)
+    req._send_json({'success': True, 'orders': orders, **extra})
+
+@router.route('GET', '/api/orders/{order_id:int}/items')
+def list_order_items(req, order_id):
+    items = order_api.get_order_items(order_id)
+    req._send_json({'success': True, 'items': items})
+
+@router.route('POST', '/api/orders')
+@idempotent
+def create_order(req):
+    data = req.body
+    success, message, order_id = order_api.create_order(
+        data.get('user_id'),
+        data.get('user_data'),
+        data.get('cart_items'),
+        data.get('payment_method')
+    )
+    req._send_json({'success': success, 'message': message, 'order_id': order_id})
+
+@router.route('PUT', '/api/orders/{order_id}/status')
+def update_order_status(req, order_id):
+    # order_id is the public order code (orders.oid)
+    data = req.body
+    success, message = order_api.update_order_status(
+        order_id,
+        data.get('user_id'),
+        data.get('action')
+    )
+    req._send_json({'success': success, 'message': message})
+
+# Admin endpoints
+@router.route('GET', '/api/admin/dashboard/stats')
+def admin_dashboard_stats(req):
+    stats = dashboard_stats.admin_stats()
+    req._send_json({'success': True, 'stats': stats})
+
+@router.route('GET', '/api/admin/products')
+def admin_list_products(req):
+    _paged_products(req, admin_api.get_all_products)
+
+@router.route('POST', '/api/admin/products')
+def admin_add_product(req):
+    success, message = admin_api.add_product(req.body)
+    req._send_json({'success': success, 'message': message})
+
+@router.route('PUT', '/api/admin/products/{product_id:int}')
+def admin_update_product(req, product_id):
+    success, message = admin_api.update_product(product_id, req.body)
+    req._send_json({'success': success, 'message': message})
+
+@router.route('DELETE', '/api/admin/products/{product_id:int}')
+def admin_delete_product(req, product_id):
+    success, message = admin_api.delete_product(product_id)
+    req._send_json({'success': success, 'message': message})
+
+@router.route('GET', '/api/admin/orders')
+def admin_list_orders(req):
+    status = req.query.get('status', 'all')
+    search = req.query.get('search', '')
+    page = _paged(
+        req,
+        MANAGED_ORDER_COLUMNS,
+        lambda fields: admin_api.get_all_orders(status, search, fields),
+        lambda limit, after, fields: admin_api.get_all_orders_page(status, search, limit, after, fields)
+    )
+    if page is None:
+        return
+    orders, extra = page
+    if 'items' in _includes(req):
+        order_api.attach_items(orders)
+    req._send_json({'success': True, 'orders': orders, **extra})
+
+@router.route('PUT', '/api/admin/orders/{order_id:int}')
+def admin_update_order_status(req, order_id):
+    success, message = admin_api.update_order_status(order_id, req.body.get('status'))
+    req._send_json({'success': success, 'message': message})
+
+@router.route('DELETE', '/api/admin/orders/{order_id:int}')
+def admin_delete_order(req, order_id):
+    success, message = admin_api.delete_order(order_id)
+    req._send_json({'success': success, 'message': message})
+
+@router.route('GET', '/api/admin/users')
+def admin_list_users(req):
+    user_type = req.query.get('type', 'all')
+    sort_by = req.query.get('sort_by', 'newest')
+    page = _paged(
+        req,
+        USER_COLUMNS,
+        lambda fields: admin_api.get_all_users(user_type, sort_by, fields),
+        lambda limit, after, fields: admin_api.get_all_users_page(user_type, sort_by, limit, after, fields)
+    )
+    if page is None:
+        return
+    users, extra = page
+    req._send_json({'success': True, 'users': users, **extra})
+
+@router.route('POST', '/api/admin/users')
+def admin_register_user(req):
+    data = req.body
+    user_type = data.pop('user_type', 'client')
+    success, message, user_id = admin_api.register_user(data, user_type)
+    req._send_json({'success': success, 'message': message, 'user_id': user_id})
+
+@router.route('PUT', '/api/admin/users/{user_id:int}')
+def admin_update_user(req, user_id):
+    success, message = admin_api.update_user_info(user_id, req.body)
+    req._send_json({'success': success, 'message': message})
+
+@router.route('DELETE', '/api/admin/users/{user_id:int}')
+def admin_delete_user(req, user_id):
+    success, message = admin_api.delete_user(user_id)
+    req._send_json({'success': success, 'message': message})
+
+# Staff endpoints
+@router.route('GET', '/api/staff/dashboard/stats')
+def staff_dashboard_stats(req):
+    stats = dashboard_stats.staff_stats()
+    req._send_json({'success': True, 'stats': stats})
+
+@router.route('GET', '/api/staff/orders')
+def staff_list_orders(req):
+    status = req.query.get('status', 'all')
+    page = _paged(
+        req,
+        MANAGED_ORDER_COLUMNS,
+        lambda fields: staff_api.get_all_orders(status, fields),
+        lambda limit, after, fields: staff_api.get_all_orders_page(status, limit, after, fields)
+    )
+    if page is None:
+        return
+    orders, extra = page
+    if 'items' in _includes(req):
+        order_api.attach_items(orders)
+    req._send_json({'success': True, 'orders': orders, **extra})
+
+@router.route('PUT', '/api/staff/orders/{order_id:int}')
+def staff_update_order_status(req, order_id):
+    success, message = staff_api.update_order_status(order_id, req.body.get('status'))
+    req._send_json({'success': success, 'message': message})
+
+@router.route('GET', '/api/staff/products')
+def staff_list_products(req):
+    _paged_products(req, staff_api.get_all_products)
+
+@router.route('PUT', '/api/staff/products/{product_id:int}')
+def staff_update_product(req, product_id):
+    success, message = staff_api.update_product(product_id, req.body)
+    req._send_json({'success': success, 'message': message})
+
+@router.route('PUT', '/api/staff/products/{product_id:int}/toggle-stock')
+def staff_toggle_stock(req, product_id):
+    success, message = staff_api.toggle_stock_status(product_id)
+    req._send_json({'success': success, 'message': message})
 
 class APIHandler(http.server.SimpleHTTPRequestHandler):
+    # Persistent connections: every response carries Content-Length
+    protocol_version = 'HTTP/1.1'
+    timeout = SERVER_CONFIG['keepalive_timeout']  # Idle seconds before a kept-alive connection is dropped
+    max_keepalive_requests = SERVER_CONFIG['keepalive_max_requests']
+    requests_handled = 0
+
+    def setup(self):
+        """Start the per-connection request counter"""
+        super().setup()
+        self.requests_handled = 0
+
+    def _send_connection_headers(self):
+        """Keep the connection open, or close it once the request cap is reached"""
+        self.requests_handled += 1
+        if not getattr(self.server, 'keep_alive', True) or self.requests_handled >= self.max_keepalive_requests:
+            self.send_header('Connection', 'close')
+        elif not self.close_connection:
+            if self.request_version == 'HTTP/1.0':
+                self.send_header('Connection', 'keep-alive')
+            remaining = self.max_keepalive_requests - self.requests_handled
+            self.send_header('Keep-Alive', f'timeout={int(self.timeout)}, max={remaining}')
+
     def do_OPTIONS(self):
         """Handle CORS preflight"""
+        self._discard_body()
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Idempotency-Key')
+        self.send_header('Content-Length', '0')
+        self._send_connection_headers()
         self.end_headers()
     
-    def _send_json(self, data, status=200):
+    def _send_json(self, data, status=200, headers=None):
         """Send JSON response"""
+        self.last_response = (status, data)
+        self._send_body(json.dumps(data, default=json_default).encode(), status, headers)
+    
+    def _send_body(self, body, status=200, headers=None):
+        """Send an already encoded JSON response body"""
         self.send_response(status)
         self.send_header('Content-Type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', '*')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self._send_connection_headers()
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
+        self.wfile.write(body)
     
     def _get_json_body(self):
         """Read JSON from request body"""
@@ -48,6 +545,12 @@ class APIHandler(http.server.SimpleHTTPRequestHandler):
         body = self.rfile.read(content_length)
         return json.loads(body.decode())
     
+    def _discard_body(self):
+        """Consume an unused request body so the next request on the connection parses cleanly"""
+        content_length = int(self.headers.get('Content-Length', 0) or 0)
+        if content_length > 0:
+            self.rfile.read(content_length)
+    
     def _get_query_params(self):
         """Parse query parameters"""
         if '?' in self.path:
@@ -55,340 +558,347 @@ class APIHandler(http.server.SimpleHTTPRequestHandler):
             return dict(urllib.parse.parse_qsl(query_string))
         return {}
     
-    def do_GET(self):
-        """Handle GET requests"""
+    def _dispatch(self, method):
+        """Route the request through the compiled route table"""
         path = self.path.split('?')[0]
-        params = self._get_query_params()
+        self.query = self._get_query_params()
         
         try:
-            # Health check
-            if path == '/api/health':
-                if db.connect():
-                    db.disconnect()
-                    self._send_json({'success': True, 'status': 'healthy', 'database': 'connected'})
-                else:
-                    self._send_json({'success': False, 'status': 'unhealthy', 'database': 'disconnected'}, 503)
-                return
-            
-            # User endpoints
-            if path.startswith('/api/user/'):
-                user_id = int(path.split('/')[-1])
-                user = user_api.get_user(user_id)
-                if user:
-                    user.pop('password', None)
-                    self._send_json({'success': True, 'user': user})
-                else:
-                    self._send_json({'success': False, 'message': 'User not found'}, 404)
-                return
-            
-            # Product endpoints
-            if path == '/api/products':
-                sort_by = params.get('sort_by', 'all')
-                search = params.get('search', '')
-                products = product_api.get_all_products(sort_by, search)
-                self._send_json({'success': True, 'products': products})
-                return
-            
-            if path.startswith('/api/products/') and path != '/api/products/categories' and not path.startswith('/api/products/category/'):
-                product_id = int(path.split('/')[-1])
-                product = product_api.get_product(product_id)
-                if product:
-                    self._send_json({'success': True, 'product': product})
-                else:
-                    self._send_json({'success': False, 'message': 'Product not found'}, 404)
-                return
-            
-            if path == '/api/products/categories':
-                categories = product_api.get_categories()
-                self._send_json({'success': True, 'categories': categories})
-                return
-            
-            if path.startswith('/api/products/category/'):
-                category = path.split('/')[-1]
-                products = product_api.get_products_by_category(category)
-                self._send_json({'success': True, 'products': products})
-                return
-            
-            # Cart endpoints
-            if path.startswith('/api/cart/') and not path.endswith('/clear'):
-                user_id = int(path.split('/')[-1])
-                cart_items = cart_api.get_cart(user_id)
-                total = cart_api.get_cart_total(user_id)
-                self._send_json({'success': True, 'cart': cart_items, 'total': total})
-                return
-            
-            # Order endpoints
-            if path.startswith('/api/orders/'):
-                parts = path.split('/')
-                if path.endswith('/items'):
-                    order_id = int(parts[-2])
-                    items = order_api.get_order_items(order_id)
-                    self._send_json({'success': True, 'items': items})
-                elif not path.endswith('/status'):
-                    # /api/orders/{user_id}
-                    user_id = int(parts[-1])
-                    status = params.get('status', 'all')
-                    sort = params.get('sort', 'ASC')
-                    orders = order_api.get_orders(user_id, status, sort)
-                    self._send_json({'success': True, 'orders': orders})
-                return
-            
-            # Admin endpoints
-            if path == '/api/admin/dashboard/stats':
-                stats = {
-                    'pending_orders': admin_api.get_total_pending_orders(),
-                    'total_orders': admin_api.get_total_orders(),
-                    'completed_orders': admin_api.get_total_completed_orders(),
-                    'total_products': admin_api.get_total_products(),
-                    'total_users': admin_api.get_total_users(),
-                    'total_admins': admin_api.get_total_admins(),
-                    'total_staff': admin_api.get_total_staff()
-                }
-                self._send_json({'success': True, 'stats': stats})
-                return
-            
-            if path == '/api/admin/products':
-                sort_by = params.get('sort_by', 'all')
-                search = params.get('search', '')
-                products = admin_api.get_all_products(sort_by, search)
-                self._send_json({'success': True, 'products': products})
-                return
-            
-            if path == '/api/admin/orders':
-                status = params.get('status', 'all')
-                search = params.get('search', '')
-                orders = admin_api.get_all_orders(status, search)
-                self._send_json({'success': True, 'orders': orders})
-                return
-            
-            if path == '/api/admin/users':
-                user_type = params.get('type', 'all')
-                sort_by = params.get('sort_by', 'newest')
-                users = admin_api.get_all_users(user_type, sort_by)
-                for user in users:
-                    user.pop('password', None)
-                self._send_json({'success': True, 'users': users})
-                return
-            
-            # Staff endpoints
-            if path == '/api/staff/dashboard/stats':
-                stats = {
-                    'pending_orders': staff_api.get_total_pending_orders(),
-                    'total_orders': staff_api.get_total_orders(),
-                    'completed_orders': staff_api.get_total_completed_orders(),
-                    'completed_value': staff_api.get_total_completed_value(),
-                    'total_products': staff_api.get_total_products()
-                }
-                self._send_json({'success': True, 'stats': stats})
-                return
-            
-            if path == '/api/staff/orders':
-                status = params.get('status', 'all')
-                orders = staff_api.get_all_orders(status)
-                self._send_json({'success': True, 'orders': orders})
-                return
-            
-            if path == '/api/staff/products':
-                sort_by = params.get('sort_by', 'all')
-                search = params.get('search', '')
-                products = staff_api.get_all_products(sort_by, search)
-                self._send_json({'success': True, 'products': products})
-                return
-            
-            self._send_json({'success': False, 'message': 'Not found'}, 404)
+            if method in ('POST', 'PUT'):
+                self.body = self._get_json_body()
+            else:
+                self._discard_body()
+                self.body = {}
+            status, handler, params = router.resolve(method, path)
+            if status == 404:
+                self._send_json({'success': False, 'message': 'Not found'}, 404)
+            elif status == 405:
+                self._send_json({'success': False, 'message': 'Method not allowed'}, 405,
+                                {'Allow': ', '.join(params['allow'] + ['OPTIONS'])})
+            else:
+                handler(self, **params)
         except Exception as e:
             self._send_json({'success': False, 'message': str(e)}, 500)
     
+    def do_GET(self):
+        """Handle GET requests"""
+        self._dispatch('GET')
+    
     def do_POST(self):
         """Handle POST requests"""
-        path = self.path.split('?')[0]
-        data = self._get_json_body()
-        
-        try:
-            # User endpoints
-            if path == '/api/user/login':
-                user = user_api.login(data.get('username'), data.get('password'))
-                if user:
-                    user.pop('password', None)
-                    self._send_json({'success': True, 'user': user})
-                else:
-                    self._send_json({'success': False, 'message': 'Invalid credentials'}, 401)
-                return
-            
-            if path == '/api/user/register':
-                success, message = user_api.register(data)
-                self._send_json({'success': success, 'message': message})
-                return
-            
-            # Cart endpoints
-            if path == '/api/cart':
-                success, message = cart_api.add_to_cart(
-                    data.get('user_id'),
-                    data.get('product_id'),
-                    data.get('quantity', 1),
-                    data.get('product_data')
-                )
-                self._send_json({'success': success, 'message': message})
-                return
-            
-            # Order endpoints
-            if path == '/api/orders':
-                success, message, order_id = order_api.create_order(
-                    data.get('user_id'),
-                    data.get('user_data'),
-                    data.get('cart_items'),
-                    data.get('payment_method')
-                )
-                self._send_json({'success': success, 'message': message, 'order_id': order_id})
-                return
-            
-            # Admin endpoints
-            if path == '/api/admin/products':
-                success, message = admin_api.add_product(data)
-                self._send_json({'success': success, 'message': message})
-                return
-            
-            if path == '/api/admin/users':
-                user_type = data.pop('user_type', 'client')
-                success, message, user_id = admin_api.register_user(data, user_type)
-                self._send_json({'success': success, 'message': message, 'user_id': user_id})
-                return
-            
-            self._send_json({'success': False, 'message': 'Not found'}, 404)
-        except Exception as e:
-            self._send_json({'success': False, 'message': str(e)}, 500)
+        self._dispatch('POST')
     
     def do_PUT(self):
         """Handle PUT requests"""
-        path = self.path.split('?')[0]
-        data = self._get_json_body()
-        
-        try:
-            # User endpoints
-            if path.endswith('/profile'):
-                user_id = int(path.split('/')[-2])
-                success, message = user_api.update_profile(user_id, data)
-                self._send_json({'success': success, 'message': message})
-                return
-            
-            if path.endswith('/address'):
-                user_id = int(path.split('/')[-2])
-                success, message = user_api.update_address(user_id, data.get('address'))
-                self._send_json({'success': success, 'message': message})
-                return
-            
-            if path.endswith('/username'):
-                user_id = int(path.split('/')[-2])
-                success, message = user_api.update_username(user_id, data.get('username'))
-                self._send_json({'success': success, 'message': message})
-                return
-            
-            # Cart endpoints
-            if path.startswith('/api/cart/') and not path.endswith('/clear'):
-                cart_id = int(path.split('/')[-1])
-                success, message = cart_api.update_quantity(cart_id, data.get('quantity'))
-                self._send_json({'success': success, 'message': message})
-                return
-            
-            # Order endpoints
-            if path.endswith('/status'):
-                order_id = int(path.split('/')[-2])
-                success, message = order_api.update_order_status(
-                    order_id,
-                    data.get('user_id'),
-                    data.get('action')
-                )
-                self._send_json({'success': success, 'message': message})
-                return
-            
-            # Admin endpoints
-            if path.startswith('/api/admin/products/'):
-                product_id = int(path.split('/')[-1])
-                success, message = admin_api.update_product(product_id, data)
-                self._send_json({'success': success, 'message': message})
-                return
-            
-            if path.startswith('/api/admin/orders/'):
-                order_id = int(path.split('/')[-1])
-                success, message = admin_api.update_order_status(order_id, data.get('status'))
-                self._send_json({'success': success, 'message': message})
-                return
-            
-            if path.startswith('/api/admin/users/'):
-                user_id = int(path.split('/')[-1])
-                success, message = admin_api.update_user_info(user_id, data)
-                self._send_json({'success': success, 'message': message})
-                return
-            
-            # Staff endpoints
-            if path.startswith('/api/staff/orders/'):
-                order_id = int(path.split('/')[-1])
-                success, message = staff_api.update_order_status(order_id, data.get('status'))
-                self._send_json({'success': success, 'message': message})
-                return
-            
-            if path.startswith('/api/staff/products/'):
-                if path.endswith('/toggle-stock'):
-                    product_id = int(path.split('/')[-2])
-                    success, message = staff_api.toggle_stock_status(product_id)
-                else:
-                    product_id = int(path.split('/')[-1])
-                    success, message = staff_api.update_product(product_id, data)
-                self._send_json({'success': success, 'message': message})
-                return
-            
-            self._send_json({'success': False, 'message': 'Not found'}, 404)
-        except Exception as e:
-            self._send_json({'success': False, 'message': str(e)}, 500)
+        self._dispatch('PUT')
     
     def do_DELETE(self):
         """Handle DELETE requests"""
-        path = self.path.split('?')[0]
-        
+        self._dispatch('DELETE')
+
+class ThreadPoolHTTPServer(socketserver.TCPServer):
+    """TCP server that hands each request to a bounded pool of worker threads.
+
+    A worker serves one request at a time, not a whole connection: between
+    requests a kept-alive connection is parked in a selector and re-queued when
+    the client sends again, so idle clients never hold a worker.
+    """
+    allow_reuse_address = True
+
+    def __init__(self, server_address, handler_class, workers=16, backlog=128, reuse_port=False, bind_and_activate=True):
+        self.request_queue_size = backlog
+        self.reuse_port = reuse_port
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api-worker')
+        # Stop accepting while every worker is busy so excess connections wait in the kernel backlog
+        self.slots = threading.BoundedSemaphore(workers)
+        self._idle = selectors.DefaultSelector()
+        self._idle_lock = threading.Lock()
+        self._parked = {}  # socket -> idle deadline of a kept-alive connection between requests
+        self._ready = collections.deque()  # Parked connections with a request waiting for a free worker
+        self._closing = False
+        self._wake_reader, self._wake_writer = socket.socketpair()
+        self._wake_writer.setblocking(False)
+        self._idle.register(self._wake_reader, selectors.EVENT_READ)
+        self._idle_thread = threading.Thread(target=self._watch_idle, name='api-keepalive', daemon=True)
+        self._idle_thread.start()
+        super().__init__(server_address, handler_class, bind_and_activate)
+
+    def server_bind(self):
+        """Bind the listening socket, sharing the port with sibling processes if requested"""
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def process_request(self, request, client_address):
+        """Queue a new connection on a worker thread"""
+        self.slots.acquire()
         try:
-            # Cart endpoints
-            if path.startswith('/api/cart/'):
-                if path.endswith('/clear'):
-                    user_id = int(path.split('/')[-2])
-                    success, message = cart_api.clear_cart(user_id)
-                else:
-                    cart_id = int(path.split('/')[-1])
-                    success, message = cart_api.remove_item(cart_id)
-                self._send_json({'success': success, 'message': message})
-                return
-            
-            # Admin endpoints
-            if path.startswith('/api/admin/products/'):
-                product_id = int(path.split('/')[-1])
-                success, message = admin_api.delete_product(product_id)
-                self._send_json({'success': success, 'message': message})
-                return
-            
-            if path.startswith('/api/admin/orders/'):
-                order_id = int(path.split('/')[-1])
-                success, message = admin_api.delete_order(order_id)
-                self._send_json({'success': success, 'message': message})
-                return
-            
-            if path.startswith('/api/admin/users/'):
-                user_id = int(path.split('/')[-1])
-                success, message = admin_api.delete_user(user_id)
-                self._send_json({'success': success, 'message': message})
-                return
-            
-            self._send_json({'success': False, 'message': 'Not found'}, 404)
-        except Exception as e:
-            self._send_json({'success': False, 'message': str(e)}, 500)
+            handler = self.RequestHandlerClass.__new__(self.RequestHandlerClass)
+            handler.request = request
+            handler.client_address = client_address
+            handler.server = self
+            handler.setup()
+        except Exception:
+            self.slots.release()
+            self.handle_error(request, client_address)
+            self.shutdown_request(request)
+            return
+        self._submit(handler)
+
+    def _submit(self, handler):
+        """Run handler on a worker; the caller holds a slot"""
+        try:
+            self.executor.submit(self._serve, handler)
+        except RuntimeError:
+            # Executor already shut down
+            self.slots.release()
+            self._close(handler)
+
+    def _serve(self, handler):
+        """Serve requests on one connection until it closes or goes idle, then take queued work"""
+        while handler is not None:
+            try:
+                while True:
+                    handler.handle_one_request()
+                    if handler.close_connection:
+                        self._close(handler)
+                        break
+                    if not self._buffered(handler):
+                        self._park(handler)
+                        break
+            except Exception:
+                self.handle_error(handler.request, handler.client_address)
+                self._close(handler)
+            with self._idle_lock:
+                handler = self._ready.popleft() if self._ready else None
+                if handler is None:
+                    self.slots.release()
+
+    @staticmethod
+    def _buffered(handler) -> bool:
+        """Whether the client already sent (part of) its next request"""
+        handler.connection.settimeout(0)
+        try:
+            return bool(handler.rfile.peek(1))
+        finally:
+            handler.connection.settimeout(handler.timeout)
 
-def run_server(port=8000):
+    def _park(self, handler):
+        """Wait for the next request on a kept-alive connection without holding a worker"""
+        with self._idle_lock:
+            if self._closing:
+                self._close(handler)
+                return
+            self._parked[handler.connection] = time.monotonic() + handler.timeout
+            self._idle.register(handler.connection, selectors.EVENT_READ, handler)
+        self._wake()
+
+    def _wake(self):
+        """Interrupt the selector so it picks up a newly parked connection or shutdown"""
+        try:
+            self._wake_writer.send(b'\0')
+        except BlockingIOError:
+            pass  # Already has a wake-up pending
+
+    def _watch_idle(self):
+        """Selector thread: re-queue parked connections that became readable, close idle ones"""
+        while not self._closing:
+            events = self._idle.select(timeout=1.0)
+            with self._idle_lock:
+                for key, _ in events:
+                    if key.fileobj is self._wake_reader:
+                        self._wake_reader.recv(4096)
+                        continue
+                    self._idle.unregister(key.fileobj)
+                    del self._parked[key.fileobj]
+                    if self.slots.acquire(blocking=False):
+                        self._submit(key.data)
+                    else:
+                        self._ready.append(key.data)  # Taken by the next worker that finishes
+                now = time.monotonic()
+                for sock, deadline in list(self._parked.items()):
+                    if deadline <= now:
+                        handler = self._idle.unregister(sock).data
+                        del self._parked[sock]
+                        self._close(handler)
+
+    def _close(self, handler):
+        try:
+            handler.finish()
+        except Exception:
+            pass
+        self.shutdown_request(handler.request)
+
+    def server_close(self):
+        """Close the listening socket, let in-flight requests finish and drop idle connections"""
+        super().server_close()
+        with self._idle_lock:
+            self._closing = True
+        self._wake()
+        self._idle_thread.join()
+        self.executor.shutdown(wait=True)
+        with self._idle_lock:
+            for key in list(self._idle.get_map().values()):
+                if key.fileobj is not self._wake_reader:
+                    self._close(key.data)
+            for handler in self._ready:
+                self._close(handler)
+            self._ready.clear()
+            self._parked.clear()
+        self._idle.close()
+        self._wake_reader.close()
+        self._wake_writer.close()
+
+def create_server(port, mode='threaded', workers=16, backlog=128):
+    """Build the HTTP server for the selected serving mode"""
+    if mode == 'single':
+        httpd = socketserver.TCPServer(("0.0.0.0", port), APIHandler)
+        # One idle keep-alive client would block everyone else
+        httpd.keep_alive = False
+        return httpd
+    if mode == 'threaded':
+        return ThreadPoolHTTPServer(("0.0.0.0", port), APIHandler, workers=workers, backlog=backlog)
+    raise ValueError(f"Unknown server mode: {mode}")
+
+def _listen_socket(port, backlog):
+    """Open the listening socket shared by pre-forked workers"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("0.0.0.0", port))
+    sock.listen(backlog)
+    return sock
+
+def _prefork_worker(slot, listen_sock, port, workers, backlog):
+    """Body of a pre-forked worker process; never returns"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The supervisor owns Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    status = 0
+    try:
+        # Each worker opens its own connection pool
+        db.reset_after_fork()
+        db.connect()
+        # Distinct order ID worker per slot keeps codes unique across processes
+        order_ids.set_worker_id((ORDER_ID_CONFIG['worker_id'] or 0) + slot)
+        if slot != 0:
+            # Table-wide maintenance only needs one process
+            jobs[:] = [job for job in jobs if job.name != 'cart-expiry']
+        start_background_jobs()
+        if listen_sock is None:
+            httpd = ThreadPoolHTTPServer(("0.0.0.0", port), APIHandler, workers, backlog, reuse_port=True)
+        else:
+            httpd = ThreadPoolHTTPServer(("0.0.0.0", port), APIHandler, workers, backlog, bind_and_activate=False)
+            httpd.socket.close()
+            httpd.socket = listen_sock
+        with httpd:
+            httpd.serve_forever()
+    except SystemExit as e:
+        status = e.code if isinstance(e.code, int) else 0
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        status = 1
+    finally:
+        db.disconnect()
+    os._exit(status)
+
+def run_prefork(port, processes, workers=16, backlog=128, reuse_port=False):
+    """Supervise pre-forked worker processes, restarting any that exit"""
+    # Workers must not inherit open database connections
+    db.disconnect()
+    listen_sock = None if reuse_port else _listen_socket(port, backlog)
+    children = {}  # pid -> slot
+    last_start = {}  # slot -> time the slot was last (re)started
+    stopping = False
+
+    def spawn(slot):
+        # Back off if a slot keeps crashing right after start
+        if time.monotonic() - last_start.get(slot, 0) < 1:
+            time.sleep(1)
+        last_start[slot] = time.monotonic()
+        pid = os.fork()
+        if pid == 0:
+            _prefork_worker(slot, listen_sock, port, workers, backlog)
+        children[pid] = slot
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for slot in range(processes):
+        spawn(slot)
+    print(f"Server running on port {port} (prefork, {processes} processes x {workers} workers)")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        slot = children.pop(pid, None)
+        if slot is None:
+            continue
+        if not stopping:
+            print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+            spawn(slot)
+    if listen_sock is not None:
+        listen_sock.close()
+
+def run_server(port=8000, mode=None):
     """Run the HTTP server"""
-    import os
     # Get port from environment (Render provides this)
     port = int(os.getenv('PORT', port))
+    mode = mode or SERVER_CONFIG['mode']
+    workers = SERVER_CONFIG['workers']
+    backlog = SERVER_CONFIG['backlog']
+    prefork = mode == 'prefork' and hasattr(os, 'fork')
+    if not prefork and ORDER_ID_CONFIG['strategy'] == 'time' and ORDER_ID_CONFIG['worker_id'] is None:
+        # Two processes on worker 0 would hand out the same order codes
+        print("ORDER_ID_WORKER must be set to a worker id unique to this process, not starting")
+        sys.exit(1)
+    # Bring the schema up to date once, before any worker starts. Checkout and carts depend on
+    # the migrated schema, so refuse to serve rather than fail every write (the host restarts us)
+    if not db.connect():
+        print("Cannot connect to the database to apply migrations, not starting")
+        sys.exit(1)
+    if not run_migrations(db):
+        print("Database migrations failed, not starting")
+        sys.exit(1)
+    if cart_store is not None:
+        cart_store.recover()  # Replay cart writes journalled before a crash
+    if mode == 'prefork':
+        if hasattr(os, 'fork'):
+            if cart_store is not None:
+                print("CART_ENGINE=memory needs a single process, writing carts to MySQL in pre-fork mode")
+                disable_cart_store()
+            processes = SERVER_CONFIG['processes'] or os.cpu_count() or 1
+            reuse_port = SERVER_CONFIG['reuse_port'] and hasattr(socket, 'SO_REUSEPORT')
+            run_prefork(port, processes, workers, backlog, reuse_port)
+            return
+        print("Pre-fork mode needs os.fork, falling back to threaded mode")
+        mode = 'threaded'
+    if mode == 'asyncio':
+        from async_server import run_async_server
+        run_async_server(port, workers, backlog)
+        return
     db.connect()
-    with socketserver.TCPServer(("0.0.0.0", port), APIHandler) as httpd:
-        print(f"Server running on port {port}")
-        httpd.serve_forever()
+    start_background_jobs()
+    with create_server(port, mode, workers, backlog) as httpd:
+        if mode == 'threaded':
+            print(f"Server running on port {port} ({mode}, {workers} workers)")
+        else:
+            print(f"Server running on port {port} ({mode})")
+        try:
+            httpd.serve_forever()
+        finally:
+            stop_background_jobs()
 
 if __name__ == "__main__":
     import sys
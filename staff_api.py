@@ -2,11 +2,18 @@
 Staff API - handles staff operations
 """
 from .database import Database
+from .catalog import ProductCatalog
+from .stats import DashboardStats
+from .pagination import fetch_page
+from .projection import select_list, with_required
+from .order_api import MANAGED_ORDER_COLUMNS
 from typing import List, Dict, Optional, Tuple
 
 class StaffAPI:
-    def __init__(self, db: Database):
+    def __init__(self, db: Database, catalog: Optional[ProductCatalog] = None, stats: Optional[DashboardStats] = None):
         self.db = db
+        self.catalog = catalog
+        self.stats = stats
     
     # Dashboard Stats
     def get_total_pending_orders(self) -> int:
@@ -40,10 +47,9 @@ class StaffAPI:
         return result[0]['total'] if result else 0
     
     # Orders Management (Staff can view and update orders)
-    def get_all_orders(self, status_filter: str = 'all') -> List[Dict]:
-        """Get all orders with optional filtering"""
-        query = """
-            SELECT orders.*, users.name, users.fname, users.mname, users.lname 
+    def _orders_query(self, status_filter: str, fields: List[str]) -> Tuple[str, List]:
+        query = f"""
+            SELECT {select_list(MANAGED_ORDER_COLUMNS, fields)} 
             FROM orders
             JOIN users ON orders.user_id = users.id
             WHERE 1=1
@@ -53,26 +59,48 @@ class StaffAPI:
         if status_filter != 'all':
             query += " AND payment_status = %s"
             params.append(status_filter)
-        
-        query += " ORDER BY placed_on DESC"
+        return query, params
+    
+    def get_all_orders(self, status_filter: str = 'all', fields: Optional[List[str]] = None) -> List[Dict]:
+        """Get all orders with optional filtering (fields: MANAGED_ORDER_COLUMNS to select, default all)"""
+        query, params = self._orders_query(status_filter, with_required(fields or MANAGED_ORDER_COLUMNS, ['id']))
+        query += " ORDER BY placed_on DESC, orders.id DESC"
         
         result = self.db.execute_query(query, tuple(params) if params else None)
         return result if result else []
     
+    def get_all_orders_page(self, status_filter: str, limit: int,
+                            after: Optional[str] = None, fields: Optional[List[str]] = None) -> Tuple[List[Dict], Optional[str]]:
+        """One page of get_all_orders, plus the cursor for the next page"""
+        columns = [('orders.placed_on', 'DESC', 'placed_on'), ('orders.id', 'DESC', 'id')]
+        fields = with_required(fields or MANAGED_ORDER_COLUMNS, [key for _, _, key in columns])
+        query, params = self._orders_query(status_filter, fields)
+        return fetch_page(self.db, query, params, columns, limit, after)
+    
     def update_order_status(self, order_id: int, status: str) -> Tuple[bool, str]:
         """Update order payment status"""
         # Map 'completed' to 'delivered' to match PHP behavior
         if status == 'completed':
             status = 'delivered'
         
+        # Previous status, so the dashboard counters can move the order between buckets
+        current = None
+        if self.stats is not None:
+            current = self.db.execute_query("SELECT payment_status, total_price FROM orders WHERE id = %s", (order_id,))
+        
         query = "UPDATE orders SET payment_status = %s WHERE id = %s"
         if self.db.execute_update(query, (status, order_id)):
+            if current:
+                self.stats.order_status_changed(current[0]['payment_status'], status, current[0]['total_price'])
             return True, "Order status updated successfully!"
         return False, "Failed to update order status!"
     
     # Products (Staff can view and update products, but not delete)
     def get_all_products(self, sort_by: str = 'all', search: str = '') -> List[Dict]:
         """Get all products with optional sorting and search"""
+        if self.catalog is not None:
+            return self.catalog.get_all_products(sort_by, search) or []
+        
         query = "SELECT * FROM products"
         params = []
         
@@ -201,6 +229,8 @@ class StaffAPI:
             )
         
         if self.db.execute_update(update_query, params):
+            if self.catalog is not None:
+                self.catalog.refresh_product(product_id)
             return True, "Product updated successfully!"
         return False, "Failed to update product!"
     
@@ -219,6 +249,8 @@ class StaffAPI:
         # Update stock status
         update_query = "UPDATE products SET stock_status = %s WHERE id = %s"
         if self.db.execute_update(update_query, (new_status, product_id)):
+            if self.catalog is not None:
+                self.catalog.update_product_fields(product_id, {'stock_status': new_status})
             return True, f"Stock status changed to '{new_status}'!"
         return False, "Failed to update stock status!"
 
@@ -2,19 +2,28 @@
 User API - handles user authentication and profile management
 """
 from .database import Database
+from .stats import DashboardStats
+from .projection import select_list
 from typing import Optional, Dict
 
+# Fields a user row exposes (password is deliberately absent so it is never selected)
+USER_COLUMNS = {name: name for name in (
+    'id', 'name', 'fname', 'mname', 'lname', 'email', 'number', 'address', 'user_type', 'profile_pic'
+)}
+USER_SELECT = select_list(USER_COLUMNS, list(USER_COLUMNS))
+
 class UserAPI:
-    def __init__(self, db: Database):
+    def __init__(self, db: Database, stats: Optional[DashboardStats] = None):
         self.db = db
+        self.stats = stats
     
     def login(self, username: str, password: str) -> Optional[Dict]:
         """Authenticate user and return user data"""
         hashed_password = Database.hash_password(password)
         
         # Check for admin or staff
-        query = """
-            SELECT * FROM users 
+        query = f"""
+            SELECT {USER_SELECT} FROM users 
             WHERE name = %s AND password = %s 
             AND (user_type = 'admin' OR user_type = 'staff')
         """
@@ -24,8 +33,8 @@ class UserAPI:
             return result[0]
         
         # Check for client
-        query = """
-            SELECT * FROM users 
+        query = f"""
+            SELECT {USER_SELECT} FROM users 
             WHERE name = %s AND password = %s 
             AND user_type = 'client'
         """
@@ -75,13 +84,15 @@ class UserAPI:
         )
         
         if self.db.execute_update(insert_query, params):
+            if self.stats is not None:
+                self.stats.user_added('client')
             return True, "Registration successful!"
         else:
             return False, "Registration failed!"
     
     def get_user(self, user_id: int) -> Optional[Dict]:
         """Get user by ID"""
-        query = "SELECT * FROM users WHERE id = %s"
+        query = f"SELECT {USER_SELECT} FROM users WHERE id = %s"
         result = self.db.execute_query(query, (user_id,))
         return result[0] if result and len(result) > 0 else None
     